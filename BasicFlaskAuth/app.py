@@ -1,5 +1,9 @@
 from flask import Flask, request, abort
+import hashlib
 import json
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
@@ -51,9 +55,110 @@ def get_token_auth_header():
     return token
 
 
+def url_fetcher(url, timeout=5):
+    """JWKS fetcher reading `url` over HTTP(S)."""
+    def fetch():
+        with urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+    return fetch
+
+
+def file_fetcher(path):
+    """JWKS fetcher reading a local file, for working offline."""
+    def fetch():
+        with open(path) as f:
+            return json.load(f)
+    return fetch
+
+
+class JWKSCache:
+    """Process-wide cache of the signing keys published at a JWKS endpoint.
+
+    Keys are served from memory for `ttl` seconds. After that the cached
+    keys are still served while one background thread refetches them
+    (stale-while-revalidate); only past `max_stale` seconds, or before
+    the first fetch, does a request wait for the fetcher. An unknown
+    `kid` triggers an immediate refetch, which is how rotated keys are
+    picked up. A failed refetch keeps the previous keys.
+
+    Every fetch the cache starts by itself (the first one, a revalidation,
+    one past `max_stale` or for an unknown `kid`) waits until
+    `min_refresh_interval` seconds after the previous attempt, so neither
+    a failing endpoint nor tokens with made-up key ids make it poll.
+    """
+
+    def __init__(self, fetcher, ttl=600, max_stale=86400, min_refresh_interval=30):
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._fetched_at = None
+        self._attempted_at = None
+        self._lock = threading.Lock()
+        self._revalidating = False
+
+    def refresh(self):
+        """Fetches the key set now. Returns False if the fetch failed."""
+        with self._lock:
+            self._attempted_at = time.monotonic()
+        try:
+            jwks = self.fetcher()
+            keys = {key['kid']: key for key in jwks['keys']}
+        except Exception:
+            return False
+        with self._lock:
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+        return True
+
+    def _claim_attempt(self):
+        """Records an attempt now, unless the last one is too recent."""
+        now = time.monotonic()
+        with self._lock:
+            if self._attempted_at is not None and \
+                    now - self._attempted_at < self.min_refresh_interval:
+                return False
+            self._attempted_at = now
+            return True
+
+    def _revalidate(self):
+        try:
+            self.refresh()
+        finally:
+            self._revalidating = False
+
+    def _age(self):
+        if self._fetched_at is None:
+            return None
+        return time.monotonic() - self._fetched_at
+
+    def get_key(self, kid):
+        """The JWK with id `kid`, or None if the issuer does not publish it."""
+        age = self._age()
+        if age is None or age > self.max_stale:
+            if self._claim_attempt():
+                self.refresh()
+                age = self._age()
+            if age is None or age > self.max_stale:
+                return None
+        elif age > self.ttl and self._claim_attempt():
+            with self._lock:
+                revalidate, self._revalidating = not self._revalidating, True
+            if revalidate:
+                threading.Thread(target=self._revalidate, daemon=True).start()
+
+        key = self._keys.get(kid)
+        if key is None and self._claim_attempt():
+            self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+
+jwks_cache = JWKSCache(url_fetcher(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'))
+
+
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
     rsa_key = {}
     if 'kid' not in unverified_header:
@@ -62,15 +167,15 @@ def verify_decode_jwt(token):
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    key = jwks_cache.get_key(unverified_header['kid'])
+    if key is not None:
+        rsa_key = {
+            'kty': key['kty'],
+            'kid': key['kid'],
+            'use': key['use'],
+            'n': key['n'],
+            'e': key['e']
+        }
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -105,12 +210,72 @@ def verify_decode_jwt(token):
             }, 400)
 
 
+class TokenCache:
+    """LRU cache of verified token payloads, keyed by a hash of the token.
+
+    A payload is served until its `exp` claim passes; tokens without
+    one are never cached. Holds at most `max_size` tokens. The payload
+    dicts are shared between requests and must not be modified.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, payload):
+        exp = payload.get('exp')
+        if not isinstance(exp, (int, float)):
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (exp, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def decode_token(token):
+    """verify_decode_jwt, skipped for tokens verified before."""
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = verify_decode_jwt(token)
+        token_cache.put(token, payload)
+    return payload
+
+
 def requires_auth(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         token = get_token_auth_header()
         try:
-            payload = verify_decode_jwt(token)
+            payload = decode_token(token)
         except:
             abort(401)
         return f(payload, *args, **kwargs)
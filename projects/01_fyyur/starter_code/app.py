@@ -10,6 +10,8 @@ from flask_moment import Moment
 from flask_migrate import Migrate
 import logging
 from logging import Formatter, FileHandler
+import instrumentation
+import search
 import shared
 
 
@@ -22,6 +24,8 @@ import shared
 app = Flask(__name__)
 app.config.from_object('config')
 shared.create_SQLAlchemy(app)
+instrumentation.init_app(app)
+search.init_app(app)
 
 
 def format_datetime(value, format='medium'):
@@ -51,11 +55,16 @@ if not app.debug:
 
 moment = Moment(app)
 mig = Migrate(app, shared.db)
-shared.init_genre()
 
 from routes import *
 app.register_blueprint(rt)
 
+from importer import import_data
+app.cli.add_command(import_data)
+
+from datagen import seed_data
+app.cli.add_command(seed_data)
+
 
 if __name__ == '__main__':
     app.run()
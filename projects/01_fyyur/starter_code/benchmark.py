@@ -0,0 +1,289 @@
+"""
+Benchmarks for Fyyur.
+
+    python benchmark.py search --rows 50000 --repeat 20
+    python benchmark.py routes --venues 2000 --shows 50000 --requests 100
+    python benchmark.py routes --driver http --threads 16 --save base.json
+    python benchmark.py routes --compare base.json --tolerance 0.2
+
+`routes` seeds a synthetic dataset (see datagen.py) and drives every
+public page, either in-process through the Flask test client or over
+HTTP against a local threaded server, and reports per route the
+latency percentiles, the throughput and the SQL statements per request
+(read from the Server-Timing header). Results can be saved as a JSON
+baseline and compared with a later run; the comparison exits with
+status 1 when a route's p50 or p95 got slower than the tolerance allows.
+
+Runs against DATABASE_URL when it is set (it must already be migrated),
+otherwise against a throwaway SQLite file built from the migrations.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from datagen import generate, random_name
+from shared import upgrade_database
+
+# settings that make two runs incomparable when they differ
+COMPARED_SETTINGS = ['driver', 'threads', 'venues', 'artists', 'shows']
+
+
+def load_app():
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(), 'fyyur_bench.db')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + path
+        upgrade_database(os.environ['DATABASE_URL'])
+    from app import app
+    return app
+
+
+def seed_names(rows, seed=0):
+    """Bulk-inserts `rows` venues and artists with made-up names."""
+    from models import db, Venue, Artist
+    rnd = random.Random(seed)
+    for model in [Venue, Artist]:
+        db.session.execute(model.__table__.insert(), [
+            {'name': random_name(rnd), 'city': 'San Francisco', 'state': 'CA'}
+            for _ in range(rows)
+        ])
+    db.session.commit()
+
+
+def route_plan(venue_ids, artist_ids, rnd):
+    """(route name, method, url, form) of every public page, detail pages on random ids."""
+    term = lambda: random_name(rnd).split()[1][:4].lower()
+    return [
+        ('/', 'GET', lambda: '/', None),
+        ('/venues', 'GET', lambda: '/venues', None),
+        ('/venues/<id>', 'GET', lambda: '/venues/%d' % rnd.choice(venue_ids), None),
+        ('/venues/search', 'POST', lambda: '/venues/search', lambda: {'search_term': term()}),
+        ('/venues/create', 'GET', lambda: '/venues/create', None),
+        ('/artists', 'GET', lambda: '/artists', None),
+        ('/artists/<id>', 'GET', lambda: '/artists/%d' % rnd.choice(artist_ids), None),
+        ('/artists/search', 'POST', lambda: '/artists/search', lambda: {'search_term': term()}),
+        ('/artists/create', 'GET', lambda: '/artists/create', None),
+        ('/shows', 'GET', lambda: '/shows', None),
+        ('/shows/create', 'GET', lambda: '/shows/create', None),
+    ]
+
+
+class ClientDriver:
+    """Calls the app in-process through the Flask test client."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, url, form):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        res = client.open(url, method=method, data=form)
+        res.get_data()
+        return res.status_code, res.headers.get('Server-Timing', '')
+
+    def close(self):
+        pass
+
+
+class HttpDriver:
+    """Serves the app on a local threaded server and calls it over HTTP."""
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.base = 'http://127.0.0.1:%d' % self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def request(self, method, url, form):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        try:
+            with urllib.request.urlopen(urllib.request.Request(
+                    self.base + url, data=data, method=method)) as res:
+                res.read()
+                return res.status, res.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('Server-Timing', '')
+
+    def close(self):
+        self.server.shutdown()
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def statement_count(server_timing):
+    match = re.search(r'desc="(\d+) queries"', server_timing)
+    return int(match.group(1)) if match else 0
+
+
+def bench_routes(driver, plan, requests, threads):
+    """Drives `requests` calls of each route of `plan`, interleaved, on `threads` threads."""
+    jobs = [route for route in plan for _ in range(requests)]
+    random.Random(1).shuffle(jobs)
+    samples = {name: [] for name, *_ in plan}
+
+    def call(route):
+        name, method, url, body = route
+        start = time.perf_counter()
+        status, timing = driver.request(method, url(), body() if body else None)
+        samples[name].append((time.perf_counter() - start, status, statement_count(timing)))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(call, jobs))
+    wall = time.perf_counter() - start
+
+    results = {}
+    for name, rows in samples.items():
+        latencies = [r[0] * 1000 for r in rows]
+        results[name] = {
+            'requests': len(rows),
+            'errors': sum(1 for r in rows if r[1] >= 400),
+            'mean_ms': statistics.mean(latencies),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'statements': int(statistics.median(r[2] for r in rows)),
+        }
+    return {'requests_per_s': len(jobs) / wall, 'routes': results}
+
+
+def compare(baseline, current, tolerance):
+    """Lines describing the change of each route; True when one regressed."""
+    lines, regressed = [], False
+    for key in COMPARED_SETTINGS:
+        old, new = baseline.get('settings', {}).get(key), current['settings'][key]
+        if old != new:
+            lines.append('note: {} was {} in the baseline, {} now'.format(key, old, new))
+    for name, new in current['routes'].items():
+        old = baseline['routes'].get(name)
+        if old is None:
+            continue
+        changes = []
+        for key in ['p50_ms', 'p95_ms']:
+            ratio = new[key] / old[key] if old[key] else 1.0
+            slower = ratio > 1 + tolerance
+            regressed |= slower
+            changes.append('{} {:+.0%}{}'.format(key[:3], ratio - 1, ' REGRESSION' if slower else ''))
+        if new['statements'] != old['statements']:
+            changes.append('statements {} -> {}'.format(old['statements'], new['statements']))
+        lines.append('{:<18} {}'.format(name, ', '.join(changes)))
+    lines.append('throughput {:+.0%}'.format(
+        current['requests_per_s'] / baseline['requests_per_s'] - 1))
+    return lines, regressed
+
+
+def print_routes(results):
+    print('{:<18} {:>6} {:>6} {:>9} {:>9} {:>9} {:>6}'.format(
+        'route', 'n', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'sql'))
+    for name, r in results['routes'].items():
+        print('{:<18} {:>6} {:>6} {:>9.2f} {:>9.2f} {:>9.2f} {:>6}'.format(
+            name, r['requests'], r['errors'], r['p50_ms'], r['p95_ms'], r['p99_ms'],
+            r['statements']))
+    print('throughput {:.1f} requests/s'.format(results['requests_per_s']))
+
+
+def bench_search(app, terms, repeat):
+    """Mean and p95 latency (ms) of each search backend over `terms`."""
+    from models import Venue, Artist
+    from search import search
+    results = {}
+    for backend in ['ilike', 'auto']:
+        app.config['SEARCH_BACKEND'] = backend
+        timings, found = [], 0
+        for _ in range(repeat):
+            for term in terms:
+                for model in [Venue, Artist]:
+                    start = time.perf_counter()
+                    found += len(search(model.query.with_entities(model.id),
+                                        model.name, term).all())
+                    timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        results[backend] = {
+            'mean_ms': statistics.mean(timings),
+            'p95_ms': timings[int(len(timings) * 0.95) - 1],
+            'rows': found,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    search_parser = sub.add_parser('search', help='compare name search backends')
+    search_parser.add_argument('--rows', type=int, default=20000)
+    search_parser.add_argument('--repeat', type=int, default=10)
+    search_parser.add_argument('--terms', nargs='+',
+                               default=['kab', 'zumi', 'tovera', 'velvet lo'])
+    routes_parser = sub.add_parser('routes', help='latency, throughput and SQL per page')
+    routes_parser.add_argument('--venues', type=int, default=1000)
+    routes_parser.add_argument('--artists', type=int, default=1000)
+    routes_parser.add_argument('--shows', type=int, default=10000)
+    routes_parser.add_argument('--seed', type=int, default=0)
+    routes_parser.add_argument('--requests', type=int, default=50,
+                               help='requests per route')
+    routes_parser.add_argument('--driver', choices=['client', 'http'], default='client')
+    routes_parser.add_argument('--threads', type=int, default=1)
+    routes_parser.add_argument('--cache', action='store_true',
+                               help='keep the response cache on')
+    routes_parser.add_argument('--save', metavar='FILE', help='write the results as a baseline')
+    routes_parser.add_argument('--compare', metavar='FILE', help='compare with a saved baseline')
+    routes_parser.add_argument('--tolerance', type=float, default=0.25,
+                               help='allowed slowdown before a route counts as a regression')
+    args = parser.parse_args()
+
+    app = load_app()
+    if args.command == 'search':
+        with app.app_context():
+            seed_names(args.rows)
+            results = bench_search(app, args.terms, args.repeat)
+        for backend, r in results.items():
+            print('{:<8} mean {:8.2f} ms   p95 {:8.2f} ms   rows {}'.format(
+                backend, r['mean_ms'], r['p95_ms'], r['rows']))
+        return
+
+    # the per-request SQL log lines would dominate the output
+    app.logger.setLevel(logging.WARNING)
+    if not args.cache:
+        app.config['RESPONSE_CACHE_BACKEND'] = None
+    with app.app_context():
+        _, venue_ids, artist_ids = generate(args.venues, args.artists, args.shows, args.seed)
+    plan = route_plan(venue_ids, artist_ids, random.Random(0))
+    driver = HttpDriver(app) if args.driver == 'http' else ClientDriver(app)
+    try:
+        results = bench_routes(driver, plan, args.requests, args.threads)
+    finally:
+        driver.close()
+    results['settings'] = vars(args)
+    print_routes(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            lines, regressed = compare(json.load(f), results, args.tolerance)
+        print('\n'.join(lines))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
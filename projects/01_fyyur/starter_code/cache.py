@@ -0,0 +1,222 @@
+"""
+Response cache for the read-only pages of the `rt` blueprint.
+
+    @rt.route('/venues/<int:venue_id>')
+    @response_cache.cached('venue:{venue_id}', clock=True)
+    def show_venue(venue_id): ...
+
+A page is stored under its endpoint, view arguments and query string,
+together with the versions of its tags at the time it was rendered.
+Handlers that write call `response_cache.invalidate(*tags)` after their
+commit; this bumps the tag versions so every page carrying one of them
+misses on its next request, without having to know the cache keys.
+
+Tags:
+    venues, artists, shows      the listings
+    venue:<id>, artist:<id>     the detail pages
+
+The backend comes from RESPONSE_CACHE_BACKEND: 'lru' keeps pages in this
+process (invalidations from other processes, e.g. `flask import-data`,
+are not seen and only the TTL bounds staleness), a redis:// URL shares
+pages and tag versions between processes, None disables caching. Pages
+whose past/upcoming split depends on the clock are `clock=True` and
+expire after RESPONSE_CACHE_CLOCK_TTL seconds, others after
+RESPONSE_CACHE_TTL.
+"""
+import functools
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, make_response, request, session
+
+from models import Show
+from shared import db
+
+
+class LRUBackend:
+    """In-process store; tag versions are kept apart so they are never evicted."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {}
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def counters(self, keys):
+        with self._lock:
+            return tuple(self._counters.get(k, 0) for k in keys)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class RedisBackend:
+    """Shared store for several worker processes; needs the `redis` package."""
+
+    def __init__(self, url, prefix='fyyur:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl or None)
+
+    def counters(self, keys):
+        if not keys:
+            return ()
+        values = self.client.mget([self.prefix + k for k in keys])
+        return tuple(int(v) if v is not None else 0 for v in values)
+
+    def incr(self, key):
+        self.client.incr(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def make_backend(name, max_entries):
+    if name == 'lru':
+        return LRUBackend(max_entries)
+    if name.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(name)
+    raise ValueError('unknown RESPONSE_CACHE_BACKEND {!r}'.format(name))
+
+
+class ResponseCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backends = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        name = current_app.config.get('RESPONSE_CACHE_BACKEND')
+        if not name:
+            return None
+        backend = self._backends.get(name)
+        if backend is None:
+            with self._lock:
+                backend = self._backends.get(name)
+                if backend is None:
+                    backend = make_backend(
+                        name, current_app.config.get('RESPONSE_CACHE_SIZE', 512))
+                    self._backends[name] = backend
+        return backend
+
+    def cached(self, *tags, clock=False):
+        """
+        Caches the GET responses of a view. `tags` are formatted with the
+        view arguments ('venue:{venue_id}').
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                backend = self.backend
+                # pages rendered for a flash message are one-offs
+                if backend is None or request.method != 'GET' or '_flashes' in session:
+                    return view(**kwargs)
+
+                tag_keys = ['tag:' + t.format(**kwargs) for t in tags]
+                key = 'page:{}:{}:{}'.format(
+                    request.endpoint, sorted(kwargs.items()),
+                    sorted(request.args.items(multi=True)))
+                versions = backend.counters(tag_keys)
+                entry = backend.get(key)
+                if entry is not None and entry[0] == versions:
+                    self.hits += 1
+                    _, status, content_type, body = entry
+                    response = current_app.response_class(
+                        body, status=status, content_type=content_type)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self.misses += 1
+                response = make_response(view(**kwargs))
+                if response.status_code == 200 and not session.modified \
+                        and not response.direct_passthrough:
+                    config = current_app.config
+                    ttl = config.get('RESPONSE_CACHE_CLOCK_TTL', 60) if clock \
+                        else config.get('RESPONSE_CACHE_TTL')
+                    backend.set(key, (versions, response.status_code,
+                                      response.content_type, response.get_data()), ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        backend = self.backend
+        if backend is None:
+            return
+        for tag in dict.fromkeys(tags):
+            backend.incr('tag:' + tag)
+
+    def clear(self):
+        for backend in self._backends.values():
+            backend.clear()
+
+
+response_cache = ResponseCache()
+
+
+def venue_tags(venue_id):
+    """
+    Tags of the pages showing venue `venue_id`: its own page, the listings
+    and the pages of the artists it has shows with. Collect them before
+    deleting the venue, its shows go with it.
+    """
+    artist_ids = db.session.query(Show.artist_id) \
+        .filter(Show.venue_id == venue_id).distinct()
+    return ['venues', 'shows', 'venue:{}'.format(venue_id)] + \
+        ['artist:{}'.format(a) for a, in artist_ids]
+
+
+def artist_tags(artist_id):
+    """
+    Like `venue_tags`, for artist `artist_id`. The venue listing counts
+    the upcoming shows, which go with a deleted artist.
+    """
+    venue_ids = db.session.query(Show.venue_id) \
+        .filter(Show.artist_id == artist_id).distinct()
+    return ['artists', 'shows', 'venues', 'artist:{}'.format(artist_id)] + \
+        ['venue:{}'.format(v) for v, in venue_ids]
+
+
+def show_tags(venue_id, artist_id):
+    """Tags of the pages listing a show between the venue and the artist."""
+    return ['shows', 'venues', 'venue:{}'.format(venue_id), 'artist:{}'.format(artist_id)]
@@ -8,6 +8,39 @@ DEBUG = True
 
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Shows listed per section (upcoming/past) on venue and artist pages.
+SHOWS_PER_PAGE = 12
+
+# Shows per page of the /shows listing.
+SHOW_LIST_PER_PAGE = 30
+
+# Name search: 'auto' uses the database's index (see search.py), 'ilike' never does.
+SEARCH_BACKEND = 'auto'
+
+# Response cache of the read-only pages (see cache.py): 'lru' keeps them in
+# this process, a redis:// URL shares them between processes, None disables it.
+RESPONSE_CACHE_BACKEND = 'lru'
+RESPONSE_CACHE_SIZE = 512
+# Seconds a cached page lives; pages split into past/upcoming shows by the
+# clock use the shorter one.
+RESPONSE_CACHE_TTL = 600
+RESPONSE_CACHE_CLOCK_TTL = 60
+
+# Optional read replica for GET requests (see replica.py); the environment's
+# REPLICA_DATABASE_URL is used when this is None.
+SQLALCHEMY_REPLICA_URI = None
+# Seconds a client, and the process that served it, keep reading from the
+# primary after a write.
+REPLICA_STICKY_SECONDS = 5
+
+# Database time (ms) from which a request is logged as a warning, and whether
+# a view exceeding its @query_budget raises (see instrumentation.py).
+SLOW_REQUEST_DB_MS = 100
+QUERY_BUDGET_STRICT = False
+
+# Seconds before the in-memory genre list is reloaded (see shared.GenreRegistry).
+GENRE_REGISTRY_TTL = 300
+
 
 class DatabaseURI:
 
@@ -20,3 +53,6 @@ class DatabaseURI:
     SQLALCHEMY_DATABASE_URI = "postgres://{}:{}@{}/{}".format(
         username, password, url, DATABASE_NAME)
 
+
+# The environment wins over the hard-coded credentials (tests, Heroku).
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', SQLALCHEMY_DATABASE_URI)
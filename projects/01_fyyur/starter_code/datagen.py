@@ -0,0 +1,233 @@
+"""
+Deterministic synthetic data for Fyyur at production scale.
+
+    flask seed-data --venues 100000 --artists 200000 --shows 5000000 --seed 7
+
+The same seed and sizes always produce the same rows, and each table is
+drawn from its own random stream, so changing the number of shows does
+not change the venues. The distributions follow what the pages see in
+production:
+
+- venues and artists cluster in a few big cities (Zipf over CITIES);
+- shows per venue are heavily skewed: the venue of rank r gets a share
+  proportional to 1 / r ** SHOW_SKEW, capped at one show per time slot;
+- most shows are booked with an artist from the venue's city;
+- PAST_FRACTION of the shows lie in the past two years, the rest in the
+  next year, at evening start times;
+- genres are skewed too, one to three per venue or artist.
+
+Rows are generated lazily and written in batches: COPY on PostgreSQL
+(psycopg2), executemany elsewhere. A venue never has two shows at the
+same minute, which keeps the (venue_id, artist_id, start_time) key
+unique without remembering the rows already written.
+"""
+import bisect
+import csv
+import datetime
+import io
+import itertools
+import random
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select, text
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Houston', 'TX'),
+    ('Phoenix', 'AZ'), ('Philadelphia', 'PA'), ('San Antonio', 'TX'), ('San Diego', 'CA'),
+    ('Dallas', 'TX'), ('San Jose', 'CA'), ('Austin', 'TX'), ('Jacksonville', 'FL'),
+    ('San Francisco', 'CA'), ('Columbus', 'OH'), ('Indianapolis', 'IN'), ('Seattle', 'WA'),
+    ('Denver', 'CO'), ('Washington', 'DC'), ('Boston', 'MA'), ('Nashville', 'TN'),
+    ('Detroit', 'MI'), ('Portland', 'OR'), ('Las Vegas', 'NV'), ('Memphis', 'TN'),
+    ('Louisville', 'KY'), ('Baltimore', 'MD'), ('Milwaukee', 'WI'), ('Albuquerque', 'NM'),
+    ('Tucson', 'AZ'), ('Fresno', 'CA'), ('Atlanta', 'GA'), ('Miami', 'FL'),
+    ('New Orleans', 'LA'), ('Minneapolis', 'MN'), ('Tampa', 'FL'), ('Pittsburgh', 'PA'),
+]
+WORDS = ['the', 'musical', 'hop', 'park', 'square', 'live', 'music', 'coffee',
+         'dueling', 'pianos', 'bar', 'jazz', 'blue', 'note', 'hall', 'club',
+         'garden', 'stage', 'river', 'house', 'electric', 'velvet', 'room']
+
+CITY_SKEW = 1.0
+SHOW_SKEW = 1.1
+GENRE_SKEW = 0.8
+LOCAL_SHOWS = 0.8
+PAST_FRACTION = 0.7
+PAST_DAYS = 730
+FUTURE_DAYS = 365
+# shows start on the minute between 17:00 and 23:59
+EVENING_START, EVENING_MINUTES = 17 * 60, 7 * 60
+BATCH_SIZE = 10000
+
+
+def zipf_weights(n, skew):
+    """Cumulative weights of ranks 1..n, the rank r weighing 1 / r ** skew."""
+    return list(itertools.accumulate(1 / r ** skew for r in range(1, n + 1)))
+
+
+def stream(seed, name):
+    """The random stream of one table; string seeds are stable across runs."""
+    return random.Random('{}:{}'.format(seed, name))
+
+
+def random_name(rnd):
+    """Two common words and a rare made-up one, e.g. 'Velvet Qubarin Hall'."""
+    rare = ''.join(rnd.choice('bcdfgklmnprstvz') + rnd.choice('aeiou') for _ in range(3))
+    return ' '.join([rnd.choice(WORDS), rare, rnd.choice(WORDS)]).title()
+
+
+def share_out(total, cum_weights, cap):
+    """`total` split over the ranks in proportion to their weights, none over `cap`."""
+    scale = total / cum_weights[-1]
+    counts, previous = [], 0
+    for cum in cum_weights:
+        # rounding the running total keeps the sum exact
+        upto = int(round(cum * scale))
+        counts.append(min(cap, upto - previous))
+        previous = upto
+    return counts
+
+
+def bulk_insert(connection, table, rows, batch_size=BATCH_SIZE):
+    """Writes the dicts of `rows` in batches; returns how many were written."""
+    columns = [c.name for c in table.columns]
+    copy = connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2'
+    written = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return written
+        if copy:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in batch:
+                writer.writerow(['\\N' if row.get(c) is None else row[c] for c in columns])
+            buffer.seek(0)
+            cursor = connection.connection.cursor()
+            cursor.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')".format(
+                table.name, ', '.join(c for c in columns)), buffer)
+        else:
+            connection.execute(table.insert(), batch)
+        written += len(batch)
+
+
+class Generator:
+
+    def __init__(self, seed=0, now=None):
+        self.seed = seed
+        # midnight, so that the same seed gives the same times all day
+        self.today = (now or datetime.datetime.now()).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+        self.city_weights = zipf_weights(len(CITIES), CITY_SKEW)
+
+    def city_of(self, rnd):
+        return CITIES[bisect.bisect(self.city_weights, rnd.random() * self.city_weights[-1])]
+
+    def people(self, kind, first_id, n):
+        """Venue or artist rows; `kind` is 'venue' or 'artist'."""
+        rnd = stream(self.seed, kind)
+        for i in range(first_id, first_id + n):
+            city, state = self.city_of(rnd)
+            row = {
+                'id': i, 'name': random_name(rnd), 'city': city, 'state': state,
+                'phone': '{}-{}-{}'.format(rnd.randint(200, 999), rnd.randint(200, 999),
+                                           rnd.randint(1000, 9999)),
+                'image_link': 'https://picsum.photos/seed/{}{}/300'.format(kind, i),
+                'facebook_link': None, 'website': None,
+                'seeking_description': None,
+            }
+            if kind == 'venue':
+                row.update(address='{} {} Street'.format(rnd.randint(1, 9999), rnd.choice(WORDS).title()),
+                           seeking_talent=rnd.random() < 0.4)
+            else:
+                row['seeking_venue'] = rnd.random() < 0.5
+            yield row
+
+    def genre_links(self, kind, first_id, n, genre_ids):
+        rnd = stream(self.seed, kind + '_genre')
+        weights = zipf_weights(len(genre_ids), GENRE_SKEW)
+        for i in range(first_id, first_id + n):
+            picked = {genre_ids[bisect.bisect(weights, rnd.random() * weights[-1])]
+                      for _ in range(rnd.randint(1, 3))}
+            for g in sorted(picked):
+                yield {kind + '_id': i, 'genre_id': g}
+
+    def shows(self, venues, artists, n):
+        """
+        Show rows for `n` shows (fewer when the busiest venues run out of
+        time slots). `venues` and `artists` are lists of (id, city) in
+        generation order, which is also the popularity rank.
+        """
+        rnd = stream(self.seed, 'show')
+        past_slots = PAST_DAYS * EVENING_MINUTES
+        future_slots = FUTURE_DAYS * EVENING_MINUTES
+        counts = share_out(n, zipf_weights(len(venues), SHOW_SKEW), past_slots + future_slots)
+
+        artist_weights = zipf_weights(len(artists), SHOW_SKEW)
+        by_city = {}
+        for artist_id, city in artists:
+            by_city.setdefault(city, []).append(artist_id)
+
+        def start_time(slot, first_day):
+            day, minute = divmod(slot, EVENING_MINUTES)
+            return self.today + datetime.timedelta(days=first_day + day,
+                                                   minutes=EVENING_START + minute)
+
+        for (venue_id, city), count in zip(venues, counts):
+            past = min(past_slots, sum(rnd.random() < PAST_FRACTION for _ in range(count)))
+            future = min(future_slots, count - past)
+            local = by_city.get(city)
+            times = [start_time(s, -PAST_DAYS) for s in rnd.sample(range(past_slots), past)] + \
+                    [start_time(s, 1) for s in rnd.sample(range(future_slots), future)]
+            for when in times:
+                if local and rnd.random() < LOCAL_SHOWS:
+                    artist_id = rnd.choice(local)
+                else:
+                    artist_id = artists[bisect.bisect(
+                        artist_weights, rnd.random() * artist_weights[-1])][0]
+                yield {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': when}
+
+
+def generate(venues, artists, shows, seed=0, now=None):
+    """
+    Inserts the synthetic venues, artists and shows after the existing
+    rows; returns ({table name: rows written}, venue ids, artist ids).
+    """
+    from models import db, Genre, Venue, Artist, Show, venue_genre, artist_genre
+    gen = Generator(seed, now)
+    connection = db.session.connection()
+    genre_ids = [g for g, in connection.execute(select([Genre.id]).order_by(Genre.id))]
+    written, ids, places = {}, {}, {}
+    for kind, model, links, n in [('venue', Venue, venue_genre, venues),
+                                  ('artist', Artist, artist_genre, artists)]:
+        first = (connection.execute(select([func.max(model.id)])).scalar() or 0) + 1
+        written[model.__tablename__] = bulk_insert(
+            connection, model.__table__, gen.people(kind, first, n))
+        if genre_ids:
+            written[links.name] = bulk_insert(
+                connection, links, gen.genre_links(kind, first, n, genre_ids))
+        # the cities again, from a second pass over the same stream
+        places[kind] = [(row['id'], row['city']) for row in gen.people(kind, first, n)]
+        ids[kind] = range(first, first + n)
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text("SELECT setval('{0}_id_seq', (SELECT max(id) FROM {0}))"
+                                    .format(model.__tablename__)))
+    if places['venue'] and places['artist']:
+        written[Show.__tablename__] = bulk_insert(
+            connection, Show.__table__, gen.shows(places['venue'], places['artist'], shows))
+    db.session.commit()
+    return written, ids['venue'], ids['artist']
+
+
+@click.command('seed-data')
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=2000, show_default=True)
+@click.option('--shows', default=20000, show_default=True)
+@click.option('--seed', default=0, show_default=True)
+@with_appcontext
+def seed_data(venues, artists, shows, seed):
+    """Adds deterministic synthetic venues, artists and shows."""
+    from cache import response_cache
+    written, _, _ = generate(venues, artists, shows, seed)
+    response_cache.invalidate('venues', 'artists', 'shows')
+    for table, count in written.items():
+        click.echo('{:<14} {:>10}'.format(table, count))
@@ -8,7 +8,7 @@ from wtforms import (
     TextAreaField
 )
 from wtforms.validators import DataRequired, AnyOf, URL, Regexp, ValidationError, Optional
-from shared import genre_choice
+import shared
 
 
 # Constants
@@ -72,14 +72,25 @@ state_choices = [
 
 
 def ifArtistExists(form, field):
-    from models import Artist
-    if Artist.query.get(field.data) is None:
+    # bulk imports set `known_artist_ids` instead of querying per row
+    known = getattr(form, 'known_artist_ids', None)
+    if known is not None:
+        exists = field.data.isdigit() and int(field.data) in known
+    else:
+        from models import Artist
+        exists = Artist.query.get(field.data) is not None
+    if not exists:
         raise ValidationError('Artist not listed in our database')
 
 def ifVenueExists(form, field):
-    from models import Venue
-    if Venue.query.get(field.data) is None:
-        raise ValidationError('Artist not listed in our database')
+    known = getattr(form, 'known_venue_ids', None)
+    if known is not None:
+        exists = field.data.isdigit() and int(field.data) in known
+    else:
+        from models import Venue
+        exists = Venue.query.get(field.data) is not None
+    if not exists:
+        raise ValidationError('Venue not listed in our database')
 
 
 class ShowForm(FlaskForm):
@@ -123,7 +134,7 @@ class VenueForm(FlaskForm):
     )
     genres = SelectMultipleField(
         'genres', validators=[DataRequired()],
-        choices=genre_choice, coerce=int
+        coerce=int
     )
     facebook_link = StringField(
         'facebook_link', validators=[Optional(), URL()]
@@ -139,6 +150,10 @@ class VenueForm(FlaskForm):
         'seeking_description'
     )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.genres.choices = shared.genres.choices()
+
 
 class ArtistForm(FlaskForm):
     name = StringField(
@@ -162,7 +177,7 @@ class ArtistForm(FlaskForm):
     )
     genres = SelectMultipleField(
         'genres', validators=[DataRequired()],
-        choices=genre_choice, coerce=int
+        coerce=int
     )
     facebook_link = StringField(
         'facebook_link', validators=[Optional(),URL()]
@@ -175,4 +190,8 @@ class ArtistForm(FlaskForm):
     )
     seeking_description = TextAreaField(
         'seeking_description'
-    )
\ No newline at end of file
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.genres.choices = shared.genres.choices()
@@ -0,0 +1,250 @@
+"""
+Bulk import of venues, artists and shows from partner feeds.
+
+    flask import-data venues venues.csv --chunk-size 1000
+    flask import-data shows shows.ndjson --errors rejected.ndjson
+
+Rows are streamed from CSV (header row with the form field names) or
+NDJSON (one JSON object per line), validated with the same VenueForm,
+ArtistForm and ShowForm rules as the web forms, and written in chunks:
+one transaction and a few executemany statements per chunk. Genres may
+be given by id or by name, as a list in NDJSON or separated by ';' in
+CSV. Invalid rows are reported with their line number and skipped; a
+chunk the database rejects is retried row by row so that only the
+offending rows are lost.
+"""
+import csv
+import json
+import sys
+
+import click
+import dateutil.parser
+from flask.cli import with_appcontext
+from sqlalchemy import Integer, false, func, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+
+import shared
+from cache import response_cache, show_tags
+from forms import VenueForm, ArtistForm, ShowForm
+from models import Venue, Artist, Show, venue_genre, artist_genre
+
+BOOLEAN_FIELDS = {'seeking_talent', 'seeking_venue'}
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y', 'on'}
+
+
+class Kind:
+    def __init__(self, form, model, genre_table=None, owner_column=None):
+        self.form = form
+        self.model = model
+        self.genre_table = genre_table
+        self.owner_column = owner_column
+
+
+KINDS = {
+    'venues': Kind(VenueForm, Venue, venue_genre, 'venue_id'),
+    'artists': Kind(ArtistForm, Artist, artist_genre, 'artist_id'),
+    'shows': Kind(ShowForm, Show),
+}
+
+
+def read_rows(stream, fmt):
+    """Yields (line number, row dict) from a CSV or NDJSON stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield number, row if isinstance(row, dict) else None
+
+
+def formdata(row, genre_ids):
+    """The row as the MultiDict a form submission would have produced."""
+    data = MultiDict()
+    for key, value in row.items():
+        if key == 'genres':
+            if isinstance(value, str):
+                value = [v for v in value.split(';') if v.strip()]
+            for genre in value:
+                genre = str(genre).strip()
+                data.add('genres', str(genre_ids.get(genre.lower(), genre)))
+        elif key in BOOLEAN_FIELDS:
+            if str(value).strip().lower() in TRUE_VALUES:
+                data.add(key, 'y')
+        elif key == 'start_time' and value:
+            data.add(key, dateutil.parser.parse(str(value)).strftime('%Y-%m-%d %H:%M:%S'))
+        elif value is not None:
+            data.add(key, str(value).strip())
+    return data
+
+
+def form_errors(form):
+    return '; '.join('{}: {}'.format(key, ', '.join(val))
+                     for key, val in form.errors.items())
+
+
+class Importer:
+    """Validates and writes one kind of row, a chunk at a time."""
+
+    def __init__(self, kind, chunk_size=500):
+        self.kind = KINDS[kind]
+        self.chunk_size = chunk_size
+        self.db = shared.db
+        self.imported = 0
+        self.errors = []
+        # pages to invalidate once the import is done
+        self.tags = set()
+        names = shared.genres.names()
+        self.genre_ids = {d.lower(): i for i, d in names.items()}
+
+    def run(self, rows):
+        chunk = []
+        for number, row in rows:
+            chunk.append((number, row))
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        return self
+
+    def validate(self, chunk):
+        known = {}
+        if self.kind.model is Show:
+            # one query per chunk instead of two per row
+            known = {
+                'known_venue_ids': self.existing_ids(Venue, chunk, 'venue_id'),
+                'known_artist_ids': self.existing_ids(Artist, chunk, 'artist_id'),
+            }
+        valid = []
+        for number, row in chunk:
+            if row is None:
+                self.errors.append((number, 'not a JSON object'))
+                continue
+            if self.kind.model is Show and not row.get('start_time'):
+                # the form would fall back to its default, the import time
+                self.errors.append((number, 'start_time: This field is required.'))
+                continue
+            try:
+                form = self.kind.form(formdata=formdata(row, self.genre_ids),
+                                      meta={'csrf': False})
+            except (ValueError, OverflowError) as e:
+                self.errors.append((number, str(e)))
+                continue
+            for name, ids in known.items():
+                setattr(form, name, ids)
+            if form.validate():
+                valid.append((number, form))
+            else:
+                self.errors.append((number, form_errors(form)))
+        return valid
+
+    def existing_ids(self, model, chunk, key):
+        ids = {int(row[key]) for _, row in chunk
+               if row and str(row.get(key, '')).strip().isdigit()}
+        if not ids:
+            return set()
+        query = select([model.id]).where(model.id.in_(ids))
+        return {i for i, in self.db.session.execute(query)}
+
+    def values(self, form):
+        values = {}
+        for c in self.kind.model.__table__.columns:
+            if c.name in form and c.name != 'id':
+                value = form[c.name].data
+                if isinstance(c.type, Integer) and isinstance(value, str):
+                    value = int(value)
+                values[c.name] = value
+        return values
+
+    def allocate_ids(self, n):
+        """
+        Primary keys for `n` new venues/artists, in one statement.
+
+        Only the PostgreSQL sequence is safe against concurrent inserts.
+        Elsewhere the keys follow max(id): on SQLite a no-op delete first
+        takes the database's write lock, which other writers then wait
+        for until the chunk commits; other databases need the importer
+        to run while nothing else writes to the table.
+        """
+        table = self.kind.model.__table__
+        dialect = self.db.engine.dialect.name
+        if dialect == 'postgresql':
+            return [i for i, in self.db.session.execute(
+                text("SELECT nextval('{}_id_seq') FROM generate_series(1, :n)".format(table.name)),
+                {'n': n})]
+        if dialect == 'sqlite':
+            self.db.session.execute(table.delete().where(false()))
+        start = self.db.session.execute(select([func.max(table.c.id)])).scalar() or 0
+        return list(range(start + 1, start + n + 1))
+
+    def write(self, forms):
+        table = self.kind.model.__table__
+        rows = [self.values(form) for form in forms]
+        if self.kind.genre_table is None:
+            self.db.session.execute(table.insert(), rows)
+            for row in rows:
+                self.tags.update(show_tags(row['venue_id'], row['artist_id']))
+            return
+        self.tags.add(table.name)
+        links = []
+        for row, form, new_id in zip(rows, forms, self.allocate_ids(len(rows))):
+            row['id'] = new_id
+            links += [{self.kind.owner_column: new_id, 'genre_id': g}
+                      for g in dict.fromkeys(form.genres.data)]
+        self.db.session.execute(table.insert(), rows)
+        if links:
+            self.db.session.execute(self.kind.genre_table.insert(), links)
+
+    def import_chunk(self, chunk):
+        valid = self.validate(chunk)
+        if not valid:
+            return
+        try:
+            self.write([form for _, form in valid])
+            self.db.session.commit()
+            self.imported += len(valid)
+        except SQLAlchemyError:
+            self.db.session.rollback()
+            # isolate the rows the database refuses
+            for number, form in valid:
+                try:
+                    self.write([form])
+                    self.db.session.commit()
+                    self.imported += 1
+                except SQLAlchemyError as e:
+                    self.db.session.rollback()
+                    self.errors.append((number, str(getattr(e, 'orig', e))))
+
+
+@click.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+              help='Defaults to the extension of SOURCE (csv otherwise ndjson).')
+@click.option('--chunk-size', default=500, show_default=True,
+              help='Rows written per transaction.')
+@click.option('--errors', 'errors_file', type=click.File('w', encoding='utf-8'),
+              help='Write rejected rows here as NDJSON instead of stderr.')
+@with_appcontext
+def import_data(kind, source, fmt, chunk_size, errors_file):
+    """Bulk-imports KIND rows from SOURCE ('-' for stdin)."""
+    if fmt is None:
+        fmt = 'csv' if source.name.endswith('.csv') else 'ndjson'
+    importer = Importer(kind, chunk_size).run(read_rows(source, fmt))
+    response_cache.invalidate(*sorted(importer.tags))
+    for number, message in sorted(importer.errors):
+        if errors_file:
+            errors_file.write(json.dumps({'line': number, 'error': message}) + '\n')
+        else:
+            click.echo('line {}: {}'.format(number, message), err=True)
+    click.echo('{} {} imported, {} rejected'.format(
+        importer.imported, kind, len(importer.errors)))
+    if importer.errors and not errors_file:
+        sys.exit(1)
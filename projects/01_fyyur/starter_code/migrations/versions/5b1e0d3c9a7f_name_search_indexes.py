@@ -0,0 +1,71 @@
+"""name search indexes
+
+Revision ID: 5b1e0d3c9a7f
+Revises: 225fc6a40d44
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.exc import DBAPIError
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e0d3c9a7f'
+down_revision = '225fc6a40d44'
+branch_labels = None
+depends_on = None
+
+SEARCHED_TABLES = ['venues', 'artists']
+
+
+def fts5_trigram(bind):
+    """Whether SQLite has FTS5 with the trigram tokenizer (3.34+)."""
+    try:
+        bind.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x, tokenize='trigram')")
+    except DBAPIError:
+        return False
+    bind.execute('DROP TABLE temp.fts5_probe')
+    return True
+
+
+def upgrade():
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    if dialect == 'postgresql':
+        # Trigram GIN indexes serve ILIKE '%term%' and similarity().
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table in SEARCHED_TABLES:
+            op.create_index('ix_{}_name_trgm'.format(table), table, ['name'],
+                            postgresql_using='gin',
+                            postgresql_ops={'name': 'gin_trgm_ops'})
+    elif dialect == 'sqlite' and fts5_trigram(bind):
+        # External-content FTS5 tables kept in sync by triggers. Without
+        # them search.Fts5Search falls back to ILIKE.
+        for table in SEARCHED_TABLES:
+            op.execute(
+                "CREATE VIRTUAL TABLE {0}_fts USING fts5("
+                "name, content='{0}', content_rowid='id', tokenize='trigram')".format(table))
+            op.execute(
+                "CREATE TRIGGER {0}_fts_ai AFTER INSERT ON {0} BEGIN "
+                "INSERT INTO {0}_fts(rowid, name) VALUES (new.id, new.name); END".format(table))
+            op.execute(
+                "CREATE TRIGGER {0}_fts_ad AFTER DELETE ON {0} BEGIN "
+                "INSERT INTO {0}_fts({0}_fts, rowid, name) VALUES ('delete', old.id, old.name); END".format(table))
+            op.execute(
+                "CREATE TRIGGER {0}_fts_au AFTER UPDATE OF name ON {0} BEGIN "
+                "INSERT INTO {0}_fts({0}_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+                "INSERT INTO {0}_fts(rowid, name) VALUES (new.id, new.name); END".format(table))
+            op.execute("INSERT INTO {0}_fts({0}_fts) VALUES ('rebuild')".format(table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table in SEARCHED_TABLES:
+            op.drop_index('ix_{}_name_trgm'.format(table), table_name=table)
+    elif dialect == 'sqlite':
+        for table in SEARCHED_TABLES:
+            for trigger in ['ai', 'ad', 'au']:
+                op.execute('DROP TRIGGER IF EXISTS {}_fts_{}'.format(table, trigger))
+            op.execute('DROP TABLE IF EXISTS {}_fts'.format(table))
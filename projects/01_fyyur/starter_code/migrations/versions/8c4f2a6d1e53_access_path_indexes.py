@@ -0,0 +1,37 @@
+"""access path indexes
+
+Revision ID: 8c4f2a6d1e53
+Revises: 5b1e0d3c9a7f
+Create Date: 2026-10-18 18:40:12.731804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4f2a6d1e53'
+down_revision = '5b1e0d3c9a7f'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    # venue page: one venue's shows, split and sorted by start_time
+    ('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time']),
+    # artist page: the primary key (venue_id, ...) cannot serve artist_id
+    ('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time']),
+    # /shows: keyset pagination on (start_time, venue_id, artist_id)
+    ('ix_shows_start_time', 'shows', ['start_time', 'venue_id', 'artist_id']),
+    # /venues: grouped by area in (state, city, id) order
+    ('ix_venues_state_city', 'venues', ['state', 'city', 'id']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -1,3 +1,10 @@
+import datetime
+
+from sqlalchemy import and_, bindparam, event, func, select
+from sqlalchemy.orm import column_property, object_session
+
+import shared
+from replica import RoutingSession
 from shared import db
 
 venue_genre = db.Table(
@@ -21,8 +28,31 @@ class Genre(db.Model):
         return f"<Genre id={self.id} description={self.description}>"
 
 
+@event.listens_for(Genre, 'after_insert')
+@event.listens_for(Genre, 'after_update')
+@event.listens_for(Genre, 'after_delete')
+def genres_changed(mapper, connection, target):
+    # A reload before the commit would not see the change: the registry
+    # is invalidated by genres_committed.
+    object_session(target).info['genres_changed'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def genres_committed(session):
+    if session.info.pop('genres_changed', False):
+        shared.genres.invalidate()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def genres_rolled_back(session):
+    session.info.pop('genres_changed', None)
+
+
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        db.Index('ix_venues_state_city', 'state', 'city', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(), nullable=False)
@@ -99,6 +129,11 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_shows_start_time', 'start_time', 'venue_id', 'artist_id'),
+    )
     venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), primary_key=True)
     start_time = db.Column(db.DateTime, primary_key=True)
@@ -107,3 +142,23 @@ class Show(db.Model):
         return f"<Show artist={self.artist.id} venue={self.venue.id} " \
                f"start_time={self.start_time.isoformat()}> "
 
+
+def upcoming_shows_count(owner_column, owner_id):
+    """
+    Number of shows of one venue/artist starting from now on, as a
+    correlated subquery. `now` is bound when the statement is executed,
+    so the count follows the clock without any stored counter to refresh.
+    Deferred: undefer it in the queries that list counts.
+    """
+    now = bindparam('now', callable_=datetime.datetime.now,
+                    type_=db.DateTime, unique=True)
+    return column_property(
+        select([func.count()])
+        .where(and_(owner_column == owner_id, Show.start_time >= now))
+        .correlate_except(Show)
+        .as_scalar(),
+        deferred=True)
+
+
+Venue.num_upcoming_shows = upcoming_shows_count(Show.venue_id, Venue.id)
+Artist.num_upcoming_shows = upcoming_shows_count(Show.artist_id, Artist.id)
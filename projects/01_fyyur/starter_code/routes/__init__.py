@@ -1,8 +1,12 @@
 import datetime
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, current_app
+from sqlalchemy import and_, case, func, or_
+
+from models import Show
+from shared import db
 
 rt = Blueprint('rt', __name__)
-__all__ = ["artist", "error", "show", "venue", "rt"]
+__all__ = ["artist", "error", "health", "show", "venue", "rt"]
 
 
 # index
@@ -14,13 +18,76 @@ def index():
 
 # Helper
 
-def divide_shows(shows):
-    past = [s for s in shows if s.start_time < datetime.datetime.now()]
-    upcoming = [s for s in shows if s.start_time >= datetime.datetime.now()]
-    return past, upcoming
+def _page(name, total, per_page):
+    pages = max(1, -(-total // per_page))
+    page = request.args.get(name, 1, type=int)
+    return min(max(page, 1), pages), pages
+
+
+def show_sections(owner_column, owner_id, partner, partner_column, prefix):
+    """
+    Past and upcoming shows of one venue/artist, one page of each.
+
+    `owner_column` is the Show foreign key to filter on (`Show.venue_id`),
+    `partner` the model on the other side of the show (`Artist`) joined
+    through `partner_column` (`Show.artist_id`); its columns come back
+    under `prefix` ("artist_"). Both sections are split on a single `now`:
+    one statement counts them, a second one fetches the requested page of
+    each with row_number() partitioned by section. Page numbers are read
+    from the `upcoming_page`/`past_page` query arguments.
+    """
+    per_page = current_app.config.get('SHOWS_PER_PAGE', 12)
+    now = datetime.datetime.now()
+    is_upcoming = Show.start_time >= now
+
+    upcoming_count, past_count = db.session.query(
+        func.count(case([(is_upcoming, 1)])),
+        func.count(case([(Show.start_time < now, 1)]))
+    ).filter(owner_column == owner_id).one()
+    upcoming_page, upcoming_pages = _page('upcoming_page', upcoming_count, per_page)
+    past_page, past_pages = _page('past_page', past_count, per_page)
 
+    sections = {1: [], 0: []}
+    if upcoming_count or past_count:
+        section = case([(is_upcoming, 1)], else_=0)
+        # Soonest upcoming first, most recent past first.
+        rank = func.row_number().over(
+            partition_by=section,
+            order_by=[case([(is_upcoming, Show.start_time)]).asc(),
+                      Show.start_time.desc()])
+        ranked = db.session.query(
+            Show.start_time,
+            partner.id.label('id'),
+            partner.name.label('name'),
+            partner.image_link.label('image_link'),
+            section.label('upcoming'),
+            rank.label('rank')
+        ).join(partner, partner_column == partner.id) \
+            .filter(owner_column == owner_id).subquery()
 
-def num_upcoming_shows(shows):
-    return len(divide_shows(shows)[1])
+        def in_page(upcoming, page):
+            return and_(ranked.c.upcoming == upcoming,
+                        ranked.c.rank > (page - 1) * per_page,
+                        ranked.c.rank <= page * per_page)
 
+        rows = db.session.query(ranked) \
+            .filter(or_(in_page(1, upcoming_page), in_page(0, past_page))) \
+            .order_by(ranked.c.upcoming, ranked.c.rank).all()
+        for r in rows:
+            sections[r.upcoming].append({
+                prefix + "id": r.id,
+                prefix + "name": r.name,
+                prefix + "image_link": r.image_link,
+                "start_time": r.start_time.isoformat(),
+            })
 
+    return {
+        "upcoming_shows": sections[1],
+        "upcoming_shows_count": upcoming_count,
+        "upcoming_page": upcoming_page,
+        "upcoming_pages": upcoming_pages,
+        "past_shows": sections[0],
+        "past_shows_count": past_count,
+        "past_page": past_page,
+        "past_pages": past_pages,
+    }
@@ -1,18 +1,23 @@
-import datetime
 import sys
 
-from flask import render_template, request, flash, make_response, jsonify, redirect, url_for
+from flask import render_template, request, flash, make_response, jsonify, redirect, url_for, abort
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, load_only, undefer
 
-from models import Artist, Genre, Venue, Show
-from shared import db
+from models import Artist, Venue, Show
+from search import search
+from shared import db, genres
+from cache import response_cache, artist_tags
 from forms import ArtistForm
-from . import num_upcoming_shows, rt
+from instrumentation import query_budget
+from . import show_sections, rt
 
 
 
 # Works well!
 @rt.route('/artists')
+@query_budget(1)
+@response_cache.cached('artists')
 def artists():
     data = [{
         "id": a.id,
@@ -23,15 +28,17 @@ def artists():
 
 # Works well!
 @rt.route('/artists/search', methods=['POST'])
+@query_budget(1)
 def search_artists():
     tag = request.form['search_term']  # not sure how is the key defined.
-    search = "%{}%".format(tag)
-    result = Artist.query.filter(Artist.name.ilike(search)).all()
+    query = Artist.query.options(load_only(Artist.id, Artist.name),
+                                 undefer(Artist.num_upcoming_shows))
+    result = search(query, Artist.name, tag).all()
     response = {
         "count": len(result),
         "data": [{
             "id": a.id, "name": a.name,
-            "num_upcoming_shows": num_upcoming_shows(a.shows)
+            "num_upcoming_shows": a.num_upcoming_shows
         } for a in result]
     }
     return render_template('pages/search_artists.html', results=response,
@@ -39,32 +46,16 @@ def search_artists():
 
 # Works well!
 @rt.route('/artists/<int:artist_id>')
+@query_budget(3)
+@response_cache.cached('artist:{artist_id}', clock=True)
 def show_artist(artist_id):
-    at = Artist.query.get(artist_id)
-    show_query = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id)
-    upcoming = show_query.filter(Show.start_time >= datetime.datetime.now()).all()
-    past = show_query.filter(Show.start_time < datetime.datetime.now()).all()
-
-    upcoming_shows = [{
-        "venue_id": show.venue.id,
-        "venue_name": show.venue.name,
-        "venue_image_link": show.venue.image_link,
-        "start_time": show.start_time.isoformat(),
-    } for show in upcoming]
-
-    # filling out the Venues page with a “Past Performances” section
-    past_shows = [{
-        "venue_id": show.venue_id,
-        "venue_name": db.session.query(Venue).join(Show, show.venue_id==Venue.id).all()[0].name,
-        "venue_image_link": db.session.query(Venue).join(Show).filter(show.venue_id==Venue.id).all()[0].image_link,
-        "start_time": show.start_time.isoformat(),
-    } for show in past]
+    at = Artist.query.options(joinedload(Artist.genres)).get(artist_id)
+    if at is None:
+        abort(404)
 
     data = at.artist_to_dictionary()
-    data['past_shows'] = past_shows
-    data['past_shows_count'] = len(past_shows)
-    data['upcoming_shows'] = upcoming_shows
-    data['upcoming_shows_count'] = len(upcoming_shows)
+    data.update(show_sections(Show.artist_id, artist_id,
+                              Venue, Show.venue_id, "venue_"))
 
     return render_template('pages/show_artist.html', artist=data)
 
@@ -75,8 +66,10 @@ def delete_artists(artist_id):
     at = Artist.query.get(artist_id)
     name = at.name if at is not None else ''
     try:
+        tags = artist_tags(artist_id)
         db.session.delete(at)
         db.session.commit()
+        response_cache.invalidate(*tags)
         flash('Artist ' + name + ' was successfully deleted!')
     except:
         db.session.rollback()
@@ -140,8 +133,9 @@ def edit_artist_submission(artist_id):
         at.seeking_venue = bool('seeking_venue' in f)
         at.seeking_description = f['seeking_description']
         g_ids = [int(i) for i in f.getlist('genres')]
-        at.genres = db.session.query(Genre).filter(Genre.id.in_(g_ids)).all()
+        at.genres = genres.get_many(g_ids)
         db.session.commit()
+        response_cache.invalidate(*artist_tags(artist_id))
     except AssertionError:
         db.session.rollback()
         print(sys.exc_info())
@@ -177,12 +171,13 @@ def create_artist_submission():
         g_ids = [int(i) for i in f.getlist('genres')]
         at = Artist(name=f["name"], city=f['city'], state=f['state'],
                     phone=f['phone'], facebook_link=f['facebook_link'],
-                    genres=db.session.query(Genre).filter(Genre.id.in_(g_ids)).all(),
+                    genres=genres.get_many(g_ids),
                     image_link=f['image_link'], website=f['website'],
                     seeking_venue=('seeking_venue' in f), seeking_description=f['seeking_description'],
                     )
         db.session.add(at)
         db.session.commit()
+        response_cache.invalidate('artists')
         flash('Artist ' + request.form['name'] + ' was successfully listed!')
     except AssertionError:
         db.session.rollback()
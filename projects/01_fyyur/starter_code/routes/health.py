@@ -0,0 +1,12 @@
+from flask import jsonify
+
+import pooling
+from shared import db
+from . import rt
+
+
+@rt.route('/health')
+def health():
+    # database round trip plus the connection pool counters of this process
+    body, status = pooling.health(db.engine)
+    return jsonify(body), status
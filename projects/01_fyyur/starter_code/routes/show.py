@@ -1,26 +1,74 @@
+import base64
+import binascii
+import datetime
+import json
 import sys
 
-from flask import render_template, request, flash
+from flask import render_template, request, flash, abort, current_app
+from sqlalchemy import tuple_
 from sqlalchemy.exc import SQLAlchemyError
 
 from models import db, Show, Artist, Venue
+from cache import response_cache, show_tags
 from forms import ShowForm
+from instrumentation import query_budget
 import dateutil.parser
 from . import rt
 
 
+def encode_show_cursor(start_time, venue_id, artist_id):
+    """Opaque `after` token for the show following the given key."""
+    key = json.dumps([start_time.isoformat(), venue_id, artist_id])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_show_cursor(token):
+    start_time, venue_id, artist_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    return datetime.datetime.fromisoformat(start_time), int(venue_id), int(artist_id)
+
+
 # Works Well!
 @rt.route('/shows')
+@query_budget(1)
+@response_cache.cached('shows')
 def shows():
+    # Keyset pagination over the primary key order of `shows`; the `after`
+    # cursor holds the key of the last show on the previous page.
+    per_page = current_app.config.get('SHOW_LIST_PER_PAGE', 30)
+    query = db.session.query(
+        Show.venue_id, Show.artist_id, Show.start_time,
+        Venue.name.label('venue_name'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+    ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+
+    after = request.args.get('after')
+    if after:
+        try:
+            key = decode_show_cursor(after)
+        except (ValueError, TypeError, binascii.Error):
+            abort(400)
+        query = query.filter(
+            tuple_(Show.start_time, Show.venue_id, Show.artist_id) > tuple_(*key))
+
+    rows = query.order_by(Show.start_time, Show.venue_id, Show.artist_id) \
+        .limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_show_cursor(last.start_time, last.venue_id, last.artist_id)
+
     data = [{
         "venue_id": sh.venue_id,
-        "venue_name": sh.venue.name,
+        "venue_name": sh.venue_name,
         "artist_id": sh.artist_id,
-        "artist_name": sh.artist.name,
-        "artist_image_link": sh.artist.image_link,
+        "artist_name": sh.artist_name,
+        "artist_image_link": sh.artist_image_link,
         "start_time": sh.start_time.isoformat(),
-    } for sh in Show.query.all()]
-    return render_template('pages/shows.html', shows=data)
+    } for sh in rows]
+    return render_template('pages/shows.html', shows=data,
+                           next_cursor=next_cursor, first_page=not after)
 
 
 # Works Well!
@@ -58,6 +106,7 @@ def create_show_submission():
                   )
         db.session.add(sh)
         db.session.commit()
+        response_cache.invalidate(*show_tags(int(f["venue_id"]), int(f["artist_id"])))
         flash('The show is successfully added!')
     except AssertionError:
         db.session.rollback()
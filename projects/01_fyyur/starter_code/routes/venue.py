@@ -1,41 +1,54 @@
-import datetime
 import sys
+from itertools import groupby
 
-from flask import render_template, request, flash, redirect, url_for
-from models import Venue, Genre, Show, Artist
+from flask import render_template, request, flash, redirect, url_for, abort
+from models import Venue, Show, Artist
+from cache import response_cache, venue_tags
 from forms import VenueForm
-from shared import db
-from . import num_upcoming_shows, rt
+from instrumentation import query_budget
+from search import search
+from shared import db, genres
+from . import show_sections, rt
+from sqlalchemy.orm import joinedload, load_only, undefer
 from sqlalchemy.exc import SQLAlchemyError
 
 
 
 @rt.route('/venues')
+@query_budget(1)
+@response_cache.cached('venues', clock=True)
 def venues():
-    city_state = db.session.query(Venue.city, Venue.state).distinct().all()
+    # One statement: every venue with its upcoming-show count, ordered so
+    # that venues of the same area come out next to each other.
+    rows = db.session.query(
+        Venue.id, Venue.name, Venue.city, Venue.state, Venue.num_upcoming_shows
+    ).order_by(Venue.state, Venue.city, Venue.id).all()
+
     data = []
-    for city, state in city_state:
-        tmp = {"city": city, "state": state, "venues": []}
-        for vn in Venue.query.filter_by(city=city, state=state).all():
-            tmp['venues'].append({
-                "id": vn.id, "name": vn.name,
-                "num_upcoming_shows": num_upcoming_shows(vn.shows)
-            })
-        data.append(tmp)
+    for (city, state), group in groupby(rows, key=lambda r: (r.city, r.state)):
+        data.append({
+            "city": city, "state": state,
+            "venues": [{
+                "id": r.id, "name": r.name,
+                "num_upcoming_shows": r.num_upcoming_shows
+            } for r in group]
+        })
     return render_template('pages/venues.html', areas=data)
 
 # Works well!
 @rt.route('/venues/search', methods=['POST'])
+@query_budget(1)
 def search_venues():
     # case-insensitive search
     tag = request.form['search_term']
-    search = "%{}%".format(tag)
-    result = Venue.query.filter(Venue.name.ilike(search)).all()   # ilike: case insensitive search
+    query = Venue.query.options(load_only(Venue.id, Venue.name),
+                                undefer(Venue.num_upcoming_shows))
+    result = search(query, Venue.name, tag).all()
     response = {
         "count": len(result),
         "data": [{
             "id": vn.id, "name": vn.name,
-            "num_upcoming_shows": num_upcoming_shows(vn.shows)
+            "num_upcoming_shows": vn.num_upcoming_shows
         } for vn in result]
     }
     return render_template('pages/search_venues.html', results=response,
@@ -44,32 +57,16 @@ def search_venues():
 
 # works well!
 @rt.route('/venues/<int:venue_id>', methods=['GET'])
+@query_budget(3)
+@response_cache.cached('venue:{venue_id}', clock=True)
 def show_venue(venue_id):
-    vn = Venue.query.get(venue_id)
-    show_query = db.session.query(Show).join(Venue).filter(Show.venue_id == venue_id)
-    upcoming = show_query.filter(Show.start_time >= datetime.datetime.now()).all()
-    past = show_query.filter(Show.start_time < datetime.datetime.now()).all()
-
-    # Method 1: using ORM relation
-    past_shows = [{
-        "artist_id": show.artist.id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": show.start_time.isoformat(),
-    } for show in past]
-    # Method 2: using JOIN statement
-    upcoming_shows = [{
-        "artist_id": show.artist_id,
-        "artist_name": db.session.query(Artist).join(Show, show.artist_id==Artist.id).all()[0].name,
-        "artist_image_link": db.session.query(Artist).join(Show, show.artist_id==Artist.id).all()[0].image_link,
-        "start_time": show.start_time.isoformat()
-    } for show in upcoming]
+    vn = Venue.query.options(joinedload(Venue.genres)).get(venue_id)
+    if vn is None:
+        abort(404)
 
     data = vn.venue_to_dictionary()
-    data['past_shows'] = past_shows
-    data['past_shows_count'] = len(past_shows)
-    data['upcoming_shows'] = upcoming_shows
-    data['upcoming_shows_count'] = len(upcoming_shows)
+    data.update(show_sections(Show.venue_id, venue_id,
+                              Artist, Show.artist_id, "artist_"))
 
     return render_template('pages/show_venue.html', venue=data)
 
@@ -97,12 +94,13 @@ def create_venue_submission():
         g_ids = [int(i) for i in f.getlist('genres')]
         vn = Venue(name=f['name'], city=f['city'], state=f['state'], address=f['address'],
                    phone=f['phone'], facebook_link=f['facebook_link'],
-                   genres=db.session.query(Genre).filter(Genre.id.in_(g_ids)).all(),
+                   genres=genres.get_many(g_ids),
                    image_link=f['image_link'], website=f['website'],
                    seeking_talent=('seeking_talent' in f), seeking_description=f['seeking_description'],
                    )
         db.session.add(vn)
         db.session.commit()
+        response_cache.invalidate('venues')
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
     except AssertionError:
         db.session.rollback()
@@ -123,8 +121,10 @@ def delete_venue(venue_id):
     vn = Venue.query.get(venue_id)
     name = vn.name if vn is not None else ''
     try:
+        tags = venue_tags(venue_id)
         db.session.delete(vn)
         db.session.commit()
+        response_cache.invalidate(*tags)
         flash('Venue ' + name + ' was successfully deleted!')
     except SQLAlchemyError:
         db.session.rollback()
@@ -190,8 +190,9 @@ def edit_venue_submission(venue_id):
         vn.website = f['website']
         vn.seeking_talent = "seeking_talent" in f
         vn.seeking_description = f["seeking_description"]
-        vn.genres = db.session.query(Genre).filter(Genre.id.in_(g_ids)).all()
+        vn.genres = genres.get_many(g_ids)
         db.session.commit()
+        response_cache.invalidate(*venue_tags(venue_id))
         flash('Venue ' + request.form['name'] + ' was successfully updated!')
     except AssertionError:
         db.session.rollback()
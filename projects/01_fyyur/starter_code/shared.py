@@ -1,15 +1,101 @@
-from flask_sqlalchemy import SQLAlchemy
+import os
+import threading
+import time
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine
+
+import pooling
+from replica import RoutingSQLAlchemy
 
 db = None
 def create_SQLAlchemy(app):
     global db
-    db = SQLAlchemy(app)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pooling.engine_options(
+        app.config, app.config['SQLALCHEMY_DATABASE_URI'])
+    db = RoutingSQLAlchemy(app)
+
+
+class GenreRegistry:
+    """
+    In-memory copy of the genres table, so that forms and submissions
+    look genres up without a query.
+
+    The table is reloaded when it is older than GENRE_REGISTRY_TTL
+    seconds, when `invalidate()` was called (models.py does when a genre
+    insert/update/delete commits), or when an unknown id is asked for.
+    `version` counts the reloads. The loaded Genre objects are detached
+    and shared by every request; `get_many` merges them into the current
+    session without touching the database.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._genres = {}
+        self._loaded_at = None
+        self._stale = True
+        # counts invalidate() calls, so one made during a reload is kept
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._invalidations += 1
+        self._stale = True
+
+    def _refresh(self, force=False):
+        from flask import current_app
+        from models import Genre
+        ttl = current_app.config.get('GENRE_REGISTRY_TTL', 300)
+        with self._lock:
+            if not (force or self._stale or self._loaded_at is None
+                    or time.monotonic() - self._loaded_at > ttl):
+                return
+            invalidations = self._invalidations
+            session = db.create_scoped_session()
+            try:
+                loaded = session.query(Genre).order_by(Genre.id).all()
+                session.expunge_all()
+            finally:
+                session.remove()
+            self._genres = {g.id: g for g in loaded}
+            self._loaded_at = time.monotonic()
+            self._stale = self._invalidations != invalidations
+            self.version += 1
+
+    def names(self):
+        """{id: description} of every genre."""
+        self._refresh()
+        return {i: g.description for i, g in self._genres.items()}
+
+    def choices(self):
+        """(id, description) pairs for a SelectMultipleField."""
+        self._refresh()
+        return [(i, g.description) for i, g in self._genres.items()]
+
+    def get_many(self, ids):
+        """The genres with the given ids, attached to db.session."""
+        self._refresh()
+        if any(i not in self._genres for i in ids):
+            self._refresh(force=True)
+        return [db.session.merge(self._genres[i], load=False)
+                for i in ids if i in self._genres]
+
 
+genres = GenreRegistry()
 
-genre_name, genre_choice = None, None
 
-def init_genre():
-    from models import Genre
-    global genre_name, genre_choice
-    genre_name = {g.id: g.description for g in Genre.query.order_by('id').all()}
-    genre_choice = [(i, genre_name[i]) for i in genre_name.keys()]
\ No newline at end of file
+def upgrade_database(url):
+    """
+    Runs every migration script against `url`, oldest first, without
+    going through the app (which needs the schema to start).
+    """
+    engine = create_engine(url)
+    script = ScriptDirectory(os.path.join(os.path.dirname(__file__), 'migrations'))
+    revisions = reversed(list(script.walk_revisions('base', 'heads')))
+    with engine.begin() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            for revision in revisions:
+                revision.module.upgrade()
+    engine.dispose()
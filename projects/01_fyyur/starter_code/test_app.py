@@ -0,0 +1,474 @@
+import datetime
+import json
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+from shared import upgrade_database
+
+database_file = os.path.join(tempfile.mkdtemp(), 'fyyur_test.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + database_file
+
+
+# Build the schema of the throwaway database before the app connects to it.
+upgrade_database(os.environ['DATABASE_URL'])
+
+from app import app  # noqa: E402
+from models import db, Venue, Artist, Show, Genre  # noqa: E402
+import shared  # noqa: E402
+import datagen  # noqa: E402
+import search  # noqa: E402
+from cache import response_cache  # noqa: E402
+from instrumentation import QueryCounter, QueryBudgetExceeded  # noqa: E402
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and empty the tables."""
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = True
+        app.config['SHOWS_PER_PAGE'] = 12
+        app.config['SHOW_LIST_PER_PAGE'] = 30
+        # pages are cached only in test_response_cache
+        app.config['RESPONSE_CACHE_BACKEND'] = None
+        app.config['SQLALCHEMY_BINDS'] = None
+        # views over their declared @query_budget fail the test
+        app.config['QUERY_BUDGET_STRICT'] = True
+        self.client = app.test_client
+        with app.app_context():
+            for table in reversed(db.metadata.sorted_tables):
+                if table.name != 'genres':
+                    db.session.execute(table.delete())
+            db.session.commit()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+
+    def add_venues(self, n, shows_per_venue=2):
+        """Adds `n` venues spread over a few areas, each with some shows."""
+        now = datetime.datetime.now()
+        with app.app_context():
+            artist = Artist(name='artist', city='San Francisco', state='CA')
+            db.session.add(artist)
+            for i in range(n):
+                vn = Venue(name='venue %d' % i, city='city %d' % (i % 3), state='CA')
+                vn.shows = [
+                    Show(artist=artist, start_time=now + datetime.timedelta(days=d))
+                    for d in range(-1, shows_per_venue - 1)
+                ]
+                db.session.add(vn)
+            db.session.commit()
+
+    def count_queries(self, url):
+        with QueryCounter() as counter:
+            res = self.client().get(url)
+        self.assertEqual(200, res.status_code)
+        return counter.count
+
+    def test_venues(self):
+        """Test the areas listing groups venues and counts upcoming shows"""
+        self.add_venues(6, shows_per_venue=3)
+        res = self.client().get('/venues')
+        self.assertEqual(200, res.status_code)
+        page = res.get_data(as_text=True)
+        for i in range(3):
+            self.assertEqual(1, page.count('city %d, CA' % i))
+        self.assertIn('venue 5', page)
+
+    def test_venues_query_count(self):
+        """The areas listing issues the same number of statements at any size"""
+        self.add_venues(3)
+        small = self.count_queries('/venues')
+        self.add_venues(30)
+        self.assertEqual(small, self.count_queries('/venues'))
+
+    def add_shows(self, n_past, n_upcoming):
+        """Adds one venue and one artist with the given shows between them."""
+        now = datetime.datetime.now()
+        with app.app_context():
+            vn = Venue(name='venue', city='city', state='CA')
+            at = Artist(name='artist', city='city', state='CA')
+            db.session.add_all([vn, at])
+            for d in range(1, n_past + 1):
+                db.session.add(Show(venue=vn, artist=at, start_time=now - datetime.timedelta(days=d)))
+            for d in range(1, n_upcoming + 1):
+                db.session.add(Show(venue=vn, artist=at, start_time=now + datetime.timedelta(days=d)))
+            db.session.commit()
+            return vn.id, at.id
+
+    def test_show_venue(self):
+        """Test the venue page splits and pages past and upcoming shows"""
+        app.config['SHOWS_PER_PAGE'] = 4
+        venue_id, _ = self.add_shows(5, 9)
+        page = self.client().get('/venues/%d' % venue_id).get_data(as_text=True)
+        self.assertIn('9 Upcoming Shows', page)
+        self.assertIn('5 Past Shows', page)
+        self.assertIn('Page 1 of 3', page)
+        self.assertEqual(8, page.count('Show Artist Image'))
+        page = self.client().get('/venues/%d?upcoming_page=3&past_page=2' % venue_id).get_data(as_text=True)
+        self.assertIn('Page 3 of 3', page)
+        self.assertEqual(2, page.count('Show Artist Image'))
+
+    def test_show_artist(self):
+        """Test the artist page splits and pages past and upcoming shows"""
+        app.config['SHOWS_PER_PAGE'] = 4
+        _, artist_id = self.add_shows(2, 0)
+        page = self.client().get('/artists/%d' % artist_id).get_data(as_text=True)
+        self.assertIn('0 Upcoming Shows', page)
+        self.assertIn('2 Past Shows', page)
+        self.assertEqual(2, page.count('Show Venue Image'))
+        self.assertEqual(404, self.client().get('/artists/%d' % (artist_id + 1)).status_code)
+
+    def test_show_venue_query_count(self):
+        """The venue page issues the same number of statements at any size"""
+        venue_id, _ = self.add_shows(2, 2)
+        small = self.count_queries('/venues/%d' % venue_id)
+        venue_id, _ = self.add_shows(40, 40)
+        self.assertEqual(small, self.count_queries('/venues/%d' % venue_id))
+
+    def test_shows(self):
+        """Test the show listing walks every show once through its cursors"""
+        app.config['SHOW_LIST_PER_PAGE'] = 4
+        self.add_venues(5, shows_per_venue=2)   # 10 shows, pairs share a start time
+        seen, url = [], '/shows'
+        while url:
+            res = self.client().get(url)
+            self.assertEqual(200, res.status_code)
+            page = res.get_data(as_text=True)
+            seen += re.findall(r'href="/venues/(\d+)"', page)
+            cursor = re.search(r'after=([^"]+)"', page)
+            url = '/shows?after=' + cursor.group(1) if cursor else None
+        self.assertEqual(10, len(seen))
+        self.assertEqual(5, len(set(seen)))
+        self.assertEqual(400, self.client().get('/shows?after=nonsense').status_code)
+
+    def search(self, kind, term):
+        res = self.client().post('/%s/search' % kind, data={'search_term': term})
+        self.assertEqual(200, res.status_code)
+        return re.findall(r'href="/%s/(\d+)"' % kind, res.get_data(as_text=True))
+
+    def test_search(self):
+        """Test every search backend finds the same venues and artists"""
+        with app.app_context():
+            db.session.add_all([
+                Venue(name='The Musical Hop', city='San Francisco', state='CA'),
+                Venue(name='Park Square Live Music & Coffee', city='San Francisco', state='CA'),
+                Venue(name='The Dueling Pianos Bar', city='New York', state='NY'),
+                Artist(name='Guns N Petals', city='San Francisco', state='CA'),
+                Artist(name='Matt Quevedo', city='New York', state='NY'),
+            ])
+            db.session.commit()
+        for backend in ['ilike', 'auto']:
+            app.config['SEARCH_BACKEND'] = backend
+            self.assertEqual(2, len(self.search('venues', 'MUSIC')))
+            self.assertEqual(2, len(self.search('venues', 'ar')))
+            self.assertEqual(0, len(self.search('venues', 'opera')))
+            self.assertEqual(1, len(self.search('artists', 'petal')))
+        app.config['SEARCH_BACKEND'] = 'auto'
+
+        # where SQLite has no trigram tokenizer the migration creates no
+        # FTS5 tables, and 'auto' falls back to ILIKE
+        with app.app_context():
+            tables = search.fts_tables()
+            self.assertIn('venues_fts', tables)
+            search._fts_tables[db.engine] = set()
+        try:
+            self.assertEqual(2, len(self.search('venues', 'MUSIC')))
+        finally:
+            with app.app_context():
+                search._fts_tables[db.engine] = tables
+
+        # the index follows renames
+        with app.app_context():
+            vn = Venue.query.filter_by(name='The Musical Hop').one()
+            vn.name = 'The Opera House'
+            db.session.commit()
+        self.assertEqual(1, len(self.search('venues', 'opera')))
+        self.assertEqual(1, len(self.search('venues', 'music')))
+
+    def test_num_upcoming_shows(self):
+        """Test the upcoming-show counts come from SQL, not from loaded shows"""
+        venue_id, artist_id = self.add_shows(2, 3)
+        with app.app_context():
+            self.assertEqual(3, Venue.query.get(venue_id).num_upcoming_shows)
+            self.assertEqual(3, Artist.query.get(artist_id).num_upcoming_shows)
+            # a show passing into the past is counted out on the next query
+            show = Show.query.order_by(Show.start_time).all()[2]
+            show.start_time = datetime.datetime.now() - datetime.timedelta(minutes=1)
+            db.session.commit()
+            self.assertEqual(2, Venue.query.get(venue_id).num_upcoming_shows)
+
+        self.add_venues(3)
+        small = self.count_queries('/venues')
+        with QueryCounter() as counter:
+            self.search('venues', 'venue')
+        self.add_venues(30)
+        self.assertEqual(small, self.count_queries('/venues'))
+        with QueryCounter() as bigger:
+            self.search('venues', 'venue')
+        self.assertEqual(counter.count, bigger.count)
+
+    def test_response_cache(self):
+        """Test pages are served from the cache until a handler changes them"""
+        app.config['RESPONSE_CACHE_BACKEND'] = 'lru'
+        response_cache.clear()
+        venue_id, artist_id = self.add_shows(1, 1)
+        with app.app_context():
+            other = Venue(name='other venue', city='city', state='CA')
+            db.session.add(other)
+            db.session.commit()
+            other_id = other.id
+            genre_id = str(Genre.query.first().id)
+
+        for url in ['/venues', '/venues/%d' % venue_id, '/venues/%d' % other_id,
+                    '/artists/%d' % artist_id, '/shows']:
+            self.assertEqual('MISS', self.client().get(url).headers['X-Cache'])
+            self.assertEqual(0, self.count_queries(url))
+        # the query string is part of the key
+        res = self.client().get('/venues/%d?past_page=2' % venue_id)
+        self.assertEqual('MISS', res.headers['X-Cache'])
+
+        app.config['WTF_CSRF_ENABLED'] = False
+        res = self.client().post('/venues/%d/edit' % venue_id, data={
+            'name': 'renamed venue', 'city': 'city', 'state': 'CA',
+            'address': '1 Street', 'phone': '123-456-7890', 'genres': [genre_id],
+            'facebook_link': '', 'image_link': 'http://example.com/v.png', 'website': '',
+            'seeking_description': ''})
+        app.config['WTF_CSRF_ENABLED'] = True
+        self.assertEqual(302, res.status_code)
+
+        # the venue, the listings and its artist's page changed; the other venue did not
+        for url in ['/venues', '/venues/%d' % venue_id, '/artists/%d' % artist_id, '/shows']:
+            self.assertIn('renamed venue', self.client().get(url).get_data(as_text=True))
+        self.assertEqual(0, self.count_queries('/venues/%d' % other_id))
+
+        # deleting the artist deletes the show the venue listing counts
+        self.assertEqual('HIT', self.client().get('/venues').headers['X-Cache'])
+        self.client().delete('/artists/%d' % artist_id)
+        self.assertEqual('MISS', self.client().get('/venues').headers['X-Cache'])
+
+    def test_health(self):
+        """Test the health check reports the database and the pool"""
+        res = self.client().get('/health')
+        self.assertEqual(200, res.status_code)
+        body = res.get_json()
+        self.assertEqual('ok', body['status'])
+        self.assertEqual(app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'],
+                         body['pool']['size'])
+        self.assertGreater(body['pool']['checkouts'], 0)
+        self.assertEqual(0, body['pool']['timeouts'])
+
+    def test_read_replica(self):
+        """Test GET pages read the replica until a write makes them stick to the primary"""
+        replica_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'replica.db')
+        upgrade_database(replica_url)
+        replica = db.create_engine(replica_url, {})
+        replica.execute(Venue.__table__.insert(),
+                        {'name': 'replica venue', 'city': 'city', 'state': 'CA'})
+        self.add_venues(1)
+        with app.app_context():
+            genre_id = str(Genre.query.first().id)
+        app.config['SQLALCHEMY_BINDS'] = {'replica': replica_url}
+        app.config['REPLICA_STICKY_SECONDS'] = 0
+        client = self.client()
+
+        page = client.get('/venues').get_data(as_text=True)
+        self.assertIn('replica venue', page)
+        self.assertNotIn('venue 0', page)
+
+        app.config['REPLICA_STICKY_SECONDS'] = 60
+
+        app.config['WTF_CSRF_ENABLED'] = False
+        res = client.post('/venues/create', data={
+            'name': 'new venue', 'city': 'city', 'state': 'CA',
+            'address': '1 Street', 'phone': '123-456-7890',
+            'genres': [genre_id],
+            'facebook_link': '', 'image_link': 'http://example.com/v.png',
+            'website': '', 'seeking_description': ''})
+        app.config['WTF_CSRF_ENABLED'] = True
+        self.assertIn('db_primary_until', res.headers['Set-Cookie'])
+
+        # the client that wrote, and this process, read the write from the primary
+        page = client.get('/venues').get_data(as_text=True)
+        self.assertIn('new venue', page)
+        self.assertNotIn('replica venue', page)
+
+        app.config['REPLICA_STICKY_SECONDS'] = 0
+        page = self.client().get('/venues').get_data(as_text=True)
+        self.assertIn('replica venue', page)
+
+    def test_query_budget(self):
+        """Test requests report their statements and fail over their budget"""
+        venue_id, _ = self.add_shows(1, 1)
+        res = self.client().get('/venues/%d' % venue_id)
+        self.assertRegex(res.headers['Server-Timing'], r'db;dur=[\d.]+;desc="3 queries"')
+
+        view = app.view_functions['rt.show_venue']
+        view.query_budget = 2
+        try:
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client().get('/venues/%d' % venue_id)
+        finally:
+            view.query_budget = 3
+
+    def query_plans(self, url):
+        """EXPLAIN QUERY PLAN of every SELECT the page at `url` runs."""
+        with QueryCounter() as counter:
+            self.assertEqual(200, self.client().get(url).status_code)
+        engine = db.get_engine(app)
+        return [' / '.join(row[-1] for row in engine.execute(
+                    'EXPLAIN QUERY PLAN ' + statement, parameters))
+                for statement, parameters in counter.statements
+                if statement.lstrip().startswith('SELECT')]
+
+    def test_indexes_used(self):
+        """Test the listing and detail pages are served by the access path indexes"""
+        app.config['SHOW_LIST_PER_PAGE'] = 2
+        venue_id, artist_id = self.add_shows(3, 3)
+        for url, index in [('/artists/%d' % artist_id, 'ix_shows_artist_id_start_time'),
+                           ('/venues/%d' % venue_id, 'ix_shows_venue_id_start_time')]:
+            plans = self.query_plans(url)
+            # the section counts seek the index; nothing scans every show
+            self.assertIn(index, plans[1])
+            self.assertFalse(any('SCAN shows' in p for p in plans), plans)
+
+        page = self.client().get('/shows').get_data(as_text=True)
+        cursor = re.search(r'after=([^"]+)"', page).group(1)
+        plans = self.query_plans('/shows?after=' + cursor)
+        self.assertIn('ix_shows_start_time', plans[0])
+        self.assertNotIn('TEMP B-TREE', plans[0])
+
+        plans = self.query_plans('/venues')
+        self.assertIn('ix_venues_state_city', plans[0])
+        self.assertNotIn('TEMP B-TREE', plans[0])
+
+    def test_genre_registry(self):
+        """Test new genres are offered and used without a restart"""
+        with app.app_context():
+            db.session.add(Genre(description='Jazz'))
+            db.session.commit()
+            jazz = Genre.query.filter_by(description='Jazz').first().id
+        self.assertIn('Jazz', self.client().get('/venues/create').get_data(as_text=True))
+        version = shared.genres.version
+
+        form = {
+            'name': 'The Blue Note', 'city': 'New York', 'state': 'NY',
+            'address': '131 W 3rd St', 'phone': '212-475-8592',
+            'image_link': 'https://example.com/blue-note.jpg',
+            'facebook_link': '', 'website': '', 'seeking_description': '',
+            'genres': [jazz],
+        }
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client().post('/venues/create', data=form)
+        app.config['WTF_CSRF_ENABLED'] = True
+        self.assertEqual(version, shared.genres.version)
+        with app.app_context():
+            vn = Venue.query.filter_by(name='The Blue Note').one()
+            self.assertEqual(['Jazz'], [g.description for g in vn.genres])
+
+        with app.app_context():
+            db.session.add(Genre(description='Reggae'))
+            db.session.flush()
+            # a reload between the flush and the commit misses the genre
+            self.assertNotIn('Reggae', shared.genres.names().values())
+            db.session.commit()
+        self.assertIn('Reggae', self.client().get('/artists/create').get_data(as_text=True))
+        self.assertGreater(shared.genres.version, version)
+
+    def test_genre_registry_failed_load(self):
+        """Test a registry whose first load failed loads again on the next call"""
+        with app.app_context():
+            registry = shared.GenreRegistry()
+            with mock.patch.object(shared.db, 'create_scoped_session',
+                                   side_effect=RuntimeError('database unavailable')):
+                self.assertRaises(RuntimeError, registry.names)
+            self.assertEqual({g.id: g.description for g in Genre.query}, registry.names())
+            self.assertEqual(1, registry.version)
+
+    def test_import_data(self):
+        """Test the bulk import keeps valid rows and reports the others"""
+        with app.app_context():
+            db.session.add(Genre(description='Jazz'))
+            db.session.commit()
+        venues = os.path.join(tempfile.mkdtemp(), 'venues.csv')
+        with open(venues, 'w') as f:
+            f.write('name,city,state,address,phone,image_link,genres,seeking_talent\n'
+                    'The Musical Hop,San Francisco,CA,1015 Folsom Street,123-123-1234,'
+                    'https://example.com/hop.jpg,jazz,True\n'
+                    'Bad Phone,San Francisco,CA,1 Main St,1234,https://example.com/x.jpg,Jazz,\n')
+        res = app.test_cli_runner().invoke(args=['import-data', 'venues', venues, '--chunk-size', '1'])
+        self.assertIn('line 3: phone', res.output)
+        self.assertIn('1 venues imported, 1 rejected', res.output)
+
+        with app.app_context():
+            vn = Venue.query.filter_by(name='The Musical Hop').one()
+            self.assertTrue(vn.seeking_talent)
+            self.assertEqual(['Jazz'], [g.description for g in vn.genres])
+            artist = Artist(name='artist', city='city', state='CA')
+            db.session.add(artist)
+            db.session.commit()
+            venue_id, artist_id = vn.id, artist.id
+        shows = os.path.join(tempfile.mkdtemp(), 'shows.ndjson')
+        with open(shows, 'w') as f:
+            for start_time in ['2035-05-21T21:30:00', '2035-05-21T21:30:00', '2036-01-01 20:00']:
+                f.write(json.dumps({'venue_id': venue_id, 'artist_id': artist_id,
+                                    'start_time': start_time}) + '\n')
+            f.write(json.dumps({'venue_id': venue_id, 'artist_id': artist_id + 1,
+                                'start_time': '2036-01-01'}) + '\n')
+        res = app.test_cli_runner().invoke(args=['import-data', 'shows', shows])
+        self.assertIn('2 shows imported, 2 rejected', res.output)
+        self.assertIn('line 4: artist_id', res.output)
+
+    def test_import_ids_locked(self):
+        """Test no other writer inserts between the id allocation and the commit"""
+        import sqlite3
+        from importer import Importer
+        with app.app_context():
+            ids = Importer('venues').allocate_ids(2)
+            other = sqlite3.connect(database_file, timeout=0)
+            try:
+                with self.assertRaises(sqlite3.OperationalError):
+                    other.execute("INSERT INTO venues (id, name) VALUES (?, 'racing')", (ids[0],))
+            finally:
+                other.close()
+                db.session.rollback()
+
+
+    def test_generated_data(self):
+        """Test the synthetic data is deterministic and skewed like production"""
+        now = datetime.datetime(2030, 6, 1)
+        venues = [(i, 'city%d' % (i % 3)) for i in range(1, 51)]
+        artists = [(i, 'city%d' % (i % 4)) for i in range(1, 101)]
+        first = list(datagen.Generator(7, now).shows(venues, artists, 2000))
+        self.assertEqual(first, list(datagen.Generator(7, now).shows(venues, artists, 2000)))
+        self.assertNotEqual(first, list(datagen.Generator(8, now).shows(venues, artists, 2000)))
+        self.assertEqual(list(datagen.Generator(7, now).people('venue', 1, 20)),
+                         list(datagen.Generator(7, now).people('venue', 1, 30))[:20])
+
+        keys = {(s['venue_id'], s['artist_id'], s['start_time']) for s in first}
+        self.assertEqual(len(first), len(keys))
+        busiest = sum(s['venue_id'] == 1 for s in first)
+        self.assertGreater(busiest, 5 * sum(s['venue_id'] == 50 for s in first))
+        past = sum(s['start_time'] < now for s in first) / len(first)
+        self.assertAlmostEqual(datagen.PAST_FRACTION, past, delta=0.05)
+
+        with app.app_context():
+            db.session.add(Genre(description='Jazz'))
+            db.session.commit()
+        res = app.test_cli_runner().invoke(args=['seed-data', '--venues', '30', '--artists', '40',
+                                                 '--shows', '500', '--seed', '3'])
+        self.assertEqual(0, res.exit_code, res.output)
+        with app.app_context():
+            self.assertEqual(30, Venue.query.count())
+            self.assertEqual(40, Artist.query.count())
+            self.assertEqual(500, Show.query.count())
+            self.assertTrue(all(v.genres for v in Venue.query))
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
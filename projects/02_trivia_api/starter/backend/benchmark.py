@@ -0,0 +1,273 @@
+"""
+Benchmarks for the trivia API.
+
+    python benchmark.py --questions 100000 --requests 100
+    python benchmark.py --driver http --threads 16 --save base.json
+    python benchmark.py --compare base.json --tolerance 0.2
+    python benchmark.py --app both --threads 64
+
+Seeds a synthetic set of categories and questions (see datagen.py) and
+drives every read endpoint, either in-process through the Flask test
+client or over HTTP against a local threaded server, and reports per
+route the latency percentiles, the throughput and the SQL statements per
+request (read from the Server-Timing header). The question create and delete
+endpoints are left out so that every route sees the same data. Results
+can be saved as a JSON baseline and compared with a later run; the
+comparison exits with status 1 when a route's p50 or p95 got slower
+than the tolerance allows.
+
+`--app async` drives the ASGI front end (flaskr/asgi.py) in-process
+instead of the Flask app; `--app both` runs the sync and the async app on
+the same data and compares them. Saving and comparing apply to the last
+run.
+
+Runs against DATABASE_URL when it is set, otherwise against a throwaway
+SQLite file.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from datagen import WORDS, generate
+
+# settings that make two runs incomparable when they differ
+COMPARED_SETTINGS = ['app', 'driver', 'threads', 'questions']
+
+
+def load_app():
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(), 'trivia_bench.db')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    from flaskr import create_app
+    return create_app()
+
+
+def route_plan(category_ids, question_ids, rnd):
+    """(route name, method, url, json body) of every read endpoint."""
+    pages = max(1, len(question_ids) // 10)
+    return [
+        ('/categories', 'GET', lambda: '/categories', None),
+        ('/questions', 'GET', lambda: '/questions?page=%d' % rnd.randint(1, pages), None),
+        ('/questions?cat', 'GET', lambda: '/questions?current_category=%d&page=%d' % (
+            rnd.choice(category_ids), rnd.randint(1, 20)), None),
+        ('/questions?search', 'GET', lambda: '/questions?search_term=' + rnd.choice(WORDS), None),
+        ('/quizzes', 'POST', lambda: '/quizzes', lambda: {
+            'category': rnd.choice(category_ids + [-1]),
+            'previous_questions': rnd.sample(question_ids, min(5, len(question_ids)))}),
+        ('/health', 'GET', lambda: '/health', None),
+    ]
+
+
+class ClientDriver:
+    """Calls the app in-process through the Flask test client."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, url, body):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        res = client.open(url, method=method, json=body)
+        res.get_data()
+        return res.status_code, res.headers.get('Server-Timing', '')
+
+    def close(self):
+        pass
+
+
+class AsgiDriver:
+    """Calls the ASGI front end in-process, on an event loop in its own thread."""
+
+    def __init__(self, app):
+        from flaskr.asgi import AsyncApp
+        self.app = AsyncApp(app)
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def request(self, method, url, body):
+        from flaskr.asgi import request
+        status, headers, _ = asyncio.run_coroutine_threadsafe(
+            request(self.app, method, url, body), self.loop).result()
+        return status, headers.get('server-timing', '')
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.app.database.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class HttpDriver:
+    """Serves the app on a local threaded server and calls it over HTTP."""
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.base = 'http://127.0.0.1:%d' % self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def request(self, method, url, body):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base + url, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request) as res:
+                res.read()
+                return res.status, res.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('Server-Timing', '')
+
+    def close(self):
+        self.server.shutdown()
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def statement_count(server_timing):
+    match = re.search(r'desc="(\d+) queries"', server_timing)
+    return int(match.group(1)) if match else 0
+
+
+def bench_routes(driver, plan, requests, threads):
+    """Drives `requests` calls of each route of `plan`, interleaved, on `threads` threads."""
+    jobs = [route for route in plan for _ in range(requests)]
+    random.Random(1).shuffle(jobs)
+    samples = {name: [] for name, *_ in plan}
+
+    def call(route):
+        name, method, url, body = route
+        start = time.perf_counter()
+        status, timing = driver.request(method, url(), body() if body else None)
+        samples[name].append((time.perf_counter() - start, status, statement_count(timing)))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(call, jobs))
+    wall = time.perf_counter() - start
+
+    results = {}
+    for name, rows in samples.items():
+        latencies = [r[0] * 1000 for r in rows]
+        results[name] = {
+            'requests': len(rows),
+            'errors': sum(1 for r in rows if r[1] >= 400),
+            'mean_ms': statistics.mean(latencies),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'statements': int(statistics.median(r[2] for r in rows)),
+        }
+    return {'requests_per_s': len(jobs) / wall, 'routes': results}
+
+
+def compare(baseline, current, tolerance):
+    """Lines describing the change of each route; True when one regressed."""
+    lines, regressed = [], False
+    for key in COMPARED_SETTINGS:
+        old, new = baseline.get('settings', {}).get(key), current['settings'][key]
+        if old != new:
+            lines.append('note: {} was {} in the baseline, {} now'.format(key, old, new))
+    for name, new in current['routes'].items():
+        old = baseline['routes'].get(name)
+        if old is None:
+            continue
+        changes = []
+        for key in ['p50_ms', 'p95_ms']:
+            ratio = new[key] / old[key] if old[key] else 1.0
+            slower = ratio > 1 + tolerance
+            regressed |= slower
+            changes.append('{} {:+.0%}{}'.format(key[:3], ratio - 1, ' REGRESSION' if slower else ''))
+        if new['statements'] != old['statements']:
+            changes.append('statements {} -> {}'.format(old['statements'], new['statements']))
+        lines.append('{:<18} {}'.format(name, ', '.join(changes)))
+    lines.append('throughput {:+.0%}'.format(
+        current['requests_per_s'] / baseline['requests_per_s'] - 1))
+    return lines, regressed
+
+
+def print_routes(results):
+    print('{:<18} {:>6} {:>6} {:>9} {:>9} {:>9} {:>6}'.format(
+        'route', 'n', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'sql'))
+    for name, r in results['routes'].items():
+        print('{:<18} {:>6} {:>6} {:>9.2f} {:>9.2f} {:>9.2f} {:>6}'.format(
+            name, r['requests'], r['errors'], r['p50_ms'], r['p95_ms'], r['p99_ms'],
+            r['statements']))
+    print('throughput {:.1f} requests/s'.format(results['requests_per_s']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=20000)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=50, help='requests per route')
+    parser.add_argument('--driver', choices=['client', 'http'], default='client')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--save', metavar='FILE', help='write the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare with a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown before a route counts as a regression')
+    parser.add_argument('--app', choices=['sync', 'async', 'both'], default='sync')
+    args = parser.parse_args()
+    if args.app != 'sync' and args.driver == 'http':
+        parser.error('the async app is only driven in-process')
+
+    app = load_app()
+    # slow-request warnings would drown the results under load
+    app.logger.setLevel(logging.ERROR)
+    with app.app_context():
+        _, category_ids, question_ids = generate(args.questions, args.categories, args.seed)
+    from flaskr.main import cache
+    runs = {}
+    for name in ['sync', 'async'] if args.app == 'both' else [args.app]:
+        # every run starts from cold caches
+        cache.invalidate_categories()
+        cache.invalidate_questions()
+        plan = route_plan(category_ids, question_ids, random.Random(0))
+        if name == 'async':
+            driver = AsgiDriver(app)
+        else:
+            driver = HttpDriver(app) if args.driver == 'http' else ClientDriver(app)
+        try:
+            results = bench_routes(driver, plan, args.requests, args.threads)
+        finally:
+            driver.close()
+        results['settings'] = dict(vars(args), app=name)
+        if args.app == 'both':
+            print(name)
+        print_routes(results)
+        runs[name] = results
+    if args.app == 'both':
+        print('async against sync')
+        print('\n'.join(compare(runs['sync'], runs['async'], args.tolerance)[0]))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            lines, regressed = compare(json.load(f), results, args.tolerance)
+        print('\n'.join(lines))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
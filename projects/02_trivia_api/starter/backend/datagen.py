@@ -0,0 +1,126 @@
+"""
+Deterministic synthetic questions at production scale.
+
+    flask seed-data --questions 2000000 --categories 40 --seed 7
+
+The same seed and sizes always produce the same rows; categories and
+questions are drawn from separate random streams. The distributions
+follow what the endpoints see in production:
+
+- the six standard categories come first, made-up ones after them;
+- questions per category are skewed: the category of rank r holds a
+  share proportional to 1 / r ** CATEGORY_SKEW;
+- difficulties peak in the middle (DIFFICULTY_WEIGHTS);
+- question words follow a Zipf law over WORDS, so search terms range
+  from very common to rare, and questions are 5 to 14 words long.
+
+Rows are generated lazily and written in batches: COPY on PostgreSQL
+(psycopg2), executemany elsewhere.
+"""
+import bisect
+import csv
+import io
+import itertools
+import random
+
+from sqlalchemy import func, select, text
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+WORDS = ['which', 'what', 'who', 'planet', 'painter', 'river', 'capital', 'war',
+         'film', 'team', 'largest', 'first', 'century', 'famous', 'element',
+         'ocean', 'composer', 'novel', 'mountain', 'champion']
+
+CATEGORY_SKEW = 0.9
+WORD_SKEW = 1.0
+DIFFICULTY_WEIGHTS = list(itertools.accumulate([1, 3, 4, 3, 1]))
+BATCH_SIZE = 10000
+
+
+def zipf_weights(n, skew):
+    """Cumulative weights of ranks 1..n, the rank r weighing 1 / r ** skew."""
+    return list(itertools.accumulate(1 / r ** skew for r in range(1, n + 1)))
+
+
+def stream(seed, name):
+    """The random stream of one table; string seeds are stable across runs."""
+    return random.Random('{}:{}'.format(seed, name))
+
+
+def pick(rnd, items, cum_weights):
+    return items[bisect.bisect(cum_weights, rnd.random() * cum_weights[-1])]
+
+
+def bulk_insert(connection, table, rows, batch_size=BATCH_SIZE):
+    """Writes the dicts of `rows` in batches; returns how many were written."""
+    copy = connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2'
+    written = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return written
+        if copy:
+            columns = list(batch[0])
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in batch:
+                writer.writerow(['\\N' if row[c] is None else row[c] for c in columns])
+            buffer.seek(0)
+            cursor = connection.connection.cursor()
+            cursor.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')".format(
+                table.name, ', '.join(columns)), buffer)
+        else:
+            connection.execute(table.insert(), batch)
+        written += len(batch)
+
+
+def category_names(n, seed=0):
+    rnd = stream(seed, 'category')
+    names = CATEGORIES[:n]
+    for i in range(len(names) + 1, n + 1):
+        # the number keeps the names unique
+        names.append('{} {}'.format(' '.join(rnd.choice(WORDS) for _ in range(2)).title(), i))
+    return names
+
+
+def questions(n, category_ids, seed=0):
+    """Question rows; `category_ids` in popularity order."""
+    rnd = stream(seed, 'question')
+    category_weights = zipf_weights(len(category_ids), CATEGORY_SKEW)
+    word_weights = zipf_weights(len(WORDS), WORD_SKEW)
+    for _ in range(n):
+        words = [pick(rnd, WORDS, word_weights) for _ in range(rnd.randint(5, 14))]
+        yield {
+            'question': ' '.join(words).capitalize() + '?',
+            'answer': pick(rnd, WORDS, word_weights),
+            'category': pick(rnd, category_ids, category_weights),
+            'difficulty': pick(rnd, range(1, 6), DIFFICULTY_WEIGHTS),
+        }
+
+
+def generate(n_questions, n_categories=len(CATEGORIES), seed=0):
+    """
+    Adds the categories that are missing and `n_questions` questions;
+    returns ({table name: rows written}, category ids, question ids).
+    """
+    from models import db, bump_version, Category, Question
+    connection = db.session.connection()
+    existing = dict(connection.execute(select([Category.type, Category.id])).fetchall())
+    missing = [name for name in category_names(n_categories, seed) if name not in existing]
+    written = {Category.__tablename__: bulk_insert(
+        connection, Category.__table__, iter([{'type': name} for name in missing]))}
+    existing = dict(connection.execute(select([Category.type, Category.id])).fetchall())
+    category_ids = [existing[name] for name in category_names(n_categories, seed)]
+
+    first = (connection.execute(select([func.max(Question.id)])).scalar() or 0) + 1
+    rows = ({'id': i, **row} for i, row in
+            zip(itertools.count(first), questions(n_questions, category_ids, seed)))
+    written[Question.__tablename__] = bulk_insert(connection, Question.__table__, rows)
+    if connection.dialect.name == 'postgresql':
+        # explicit ids do not advance the sequence
+        connection.execute(text(
+            "SELECT setval(pg_get_serial_sequence('questions', 'id'), "
+            "COALESCE((SELECT max(id) FROM questions), 1))"))
+    bump_version(Category.__tablename__)
+    bump_version(Question.__tablename__)
+    db.session.commit()
+    return written, category_ids, range(first, first + n_questions)
@@ -1,15 +1,48 @@
-from flask import Flask
+from flask import Flask, request
 from flask_cors import CORS
 
-from models import setup_db
+from models import setup_db, setup_indexes, setup_search_index, setup_table_versions
 
 QUESTIONS_PER_PAGE = 10
 
 
 def create_app(test_config=None):
     app = Flask(__name__)
+    app.config.setdefault('SEARCH_BACKEND', 'auto')
+    # Database time (ms) from which a request is logged as a warning, and
+    # whether a view over its @query_budget raises (see instrumentation.py).
+    app.config.setdefault('SLOW_REQUEST_DB_MS', 100)
+    app.config.setdefault('QUERY_BUDGET_STRICT', False)
+    # Cache-Control per endpoint. The listings carry ETags, so 'no-cache'
+    # lets clients keep them and revalidate with a cheap 304.
+    app.config.setdefault('CACHE_CONTROL', {
+        'main.category_list': 'no-cache',
+        'main.question_list': 'no-cache',
+    })
+    # Where quiz sessions live, how long an idle one is kept (seconds) and
+    # how many the in-memory store holds (see main/quiz_sessions.py).
+    app.config.setdefault('QUIZ_SESSION_STORE', 'memory')
+    app.config.setdefault('QUIZ_SESSION_TTL', 1800)
+    app.config.setdefault('QUIZ_SESSION_LIMIT', 10000)
+    # List responses longer than this many items are streamed, in chunks
+    # of about this many bytes (see streaming.py).
+    app.config.setdefault('STREAM_JSON_THRESHOLD', 1000)
+    app.config.setdefault('STREAM_JSON_CHUNK_BYTES', 65536)
+    # How often (seconds) the caches and ETags check whether another
+    # process wrote to the tables (see main/cache.py).
+    app.config.setdefault('TABLE_VERSION_CHECK_SECONDS', 1)
+    if test_config:
+        app.config.update(test_config)
     db = setup_db(app)
     db.create_all()
+    setup_indexes()
+    setup_search_index()
+    setup_table_versions()
+
+    from . import instrumentation
+    instrumentation.init_app(app)
+    from .main import search
+    search.init_app(app)
 
     cors = CORS(app, origins='*')
 
@@ -20,8 +53,16 @@ def create_app(test_config=None):
                              'Content-Type,Authorization,true')
         response.headers.add('Access-Control-Allow-Methods',
                              'GET,PATCH,POST,DELETE,OPTIONS')
+        policy = app.config['CACHE_CONTROL'].get(request.endpoint)
+        if policy and 'Cache-Control' not in response.headers:
+            response.headers['Cache-Control'] = policy
         return response
 
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
+
+    from .commands import questions_cli, categories_cli, seed_data
+    app.cli.add_command(questions_cli)
+    app.cli.add_command(categories_cli)
+    app.cli.add_command(seed_data)
     return app
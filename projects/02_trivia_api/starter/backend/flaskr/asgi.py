@@ -0,0 +1,397 @@
+"""
+ASGI front end for the trivia API.
+
+    uvicorn --factory flaskr.asgi:create_asgi_app
+
+GET /questions, GET /categories and POST /quizzes are served by
+coroutines on the event loop. Cache hits and 304s are answered without
+leaving the loop, and a request waiting for the database holds no
+thread. Everything else (writes, /health, CORS preflights) is handed to
+the Flask app on a thread pool, so both front ends share the views'
+argument parsing, caches and ETags. The coroutines follow the Flask
+app's rules too: GET requests read from the replica when
+`replica.replica_allowed()` lets them, and every request is logged and
+held to the @query_budget of the view it stands in for.
+
+Flask 1.1 has no async views and SQLAlchemy 1.3 no asyncio support.
+With SQLAlchemy 1.4+ and an async driver installed (asyncpg, aiosqlite)
+statements run on an AsyncEngine; otherwise they run on the app's
+engine in a thread pool as large as its connection pool, so that
+requests beyond the pool wait on the loop instead of in threads.
+ASYNC_DATABASE_URI overrides the URL of the async engine.
+"""
+import asyncio
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from sqlalchemy import func, select
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_cookie, parse_etags, quote_etag
+
+import pooling
+from models import Question, Category, db
+from replica import REPLICA_BIND, STICKY_COOKIE, replica_allowed
+from . import create_app, QUESTIONS_PER_PAGE
+from .instrumentation import RequestStats, report
+from .main import cache, views
+from .main.conditional import etag
+from .streaming import dumps
+
+ASYNC_DRIVERS = {
+    'postgres': ('asyncpg', 'postgresql+asyncpg'),
+    'postgresql': ('asyncpg', 'postgresql+asyncpg'),
+    'sqlite': ('aiosqlite', 'sqlite+aiosqlite'),
+}
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type,Authorization,true'),
+    (b'access-control-allow-methods', b'GET,PATCH,POST,DELETE,OPTIONS'),
+]
+ERROR_MESSAGES = {
+    400: 'Bad Request',
+    422: 'Unprocessable Entity',
+    500: 'Internal Server Error',
+}
+
+
+class ThreadedDatabase:
+    """Runs statements on a synchronous engine in a thread pool."""
+
+    def __init__(self, engine, workers):
+        self.engine = engine
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='db')
+
+    def _fetch(self, statement):
+        with self.engine.connect() as connection:
+            return [dict(row) for row in connection.execute(statement)]
+
+    async def fetch(self, statement):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._fetch, statement)
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class AsyncEngineDatabase:
+    """Runs statements on a SQLAlchemy 1.4+ AsyncEngine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    async def fetch(self, statement):
+        async with self.engine.connect() as connection:
+            result = await connection.execute(statement)
+            return [dict(row._mapping) for row in result]
+
+    async def close(self):
+        await self.engine.dispose()
+
+
+def pool_workers(app, engine):
+    if not isinstance(engine.pool, QueuePool):
+        # an in-memory SQLite database lives in one shared connection
+        return 1
+    return pooling.setting(app.config, 'DB_POOL_SIZE') + \
+        pooling.setting(app.config, 'DB_MAX_OVERFLOW')
+
+
+def make_database(app, bind=None):
+    """
+    An AsyncEngineDatabase when the packages allow, a ThreadedDatabase
+    otherwise, on the primary or on the engine of `bind`.
+    """
+    engine = db.get_engine(app, bind)
+    async_uri = app.config.get('ASYNC_DATABASE_URI') if bind is None else None
+    url = make_url(async_uri or engine.url)
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        module, drivername = ASYNC_DRIVERS[url.get_backend_name()]
+        __import__(module)
+    except (ImportError, KeyError):
+        return ThreadedDatabase(engine, pool_workers(app, engine))
+    if not isinstance(engine.pool, QueuePool):
+        return ThreadedDatabase(engine, 1)
+    if not async_uri:
+        url = url.set(drivername=drivername)
+    options = {k: v for k, v in pooling.engine_options(app.config, url).items()
+               if k not in ('poolclass', 'connect_args')}
+    return AsyncEngineDatabase(create_async_engine(url, **options))
+
+
+class Request:
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query = MultiDict(parse_qsl(scope['query_string'].decode('latin1'),
+                                         keep_blank_values=True))
+        self.headers = {k.decode('latin1'): v.decode('latin1') for k, v in scope['headers']}
+        self.cookies = parse_cookie(self.headers.get('cookie', ''))
+        self.body = body
+        # the ThreadedDatabase or AsyncEngineDatabase the request reads from
+        self.database = None
+
+    def json(self):
+        return json.loads(self.body or b'null')
+
+    def not_modified(self, tag):
+        return parse_etags(self.headers.get('if-none-match')).contains(tag)
+
+
+class AsyncApp:
+    """ASGI application serving the read endpoints of `app` asynchronously."""
+
+    def __init__(self, app, database=None):
+        self.app = app
+        self.database = database or make_database(app)
+        self.replica = None
+        if REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {}):
+            self.replica = make_database(app, REPLICA_BIND)
+        self.wsgi_executor = ThreadPoolExecutor(
+            pool_workers(app, db.get_engine(app)), thread_name_prefix='wsgi')
+        self.routes = {
+            ('GET', '/questions'): ('main.question_list', self.questions),
+            ('GET', '/categories'): ('main.category_list', self.categories),
+            ('POST', '/quizzes'): ('main.quiz_get_next', self.quizzes),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        body = await read_body(receive)
+        route = self.routes.get((scope['method'], scope['path']))
+        if route is None:
+            return await self.call_flask(scope, body, send)
+
+        endpoint, handler = route
+        request = Request(scope, body)
+        request.database = self.database
+        if self.replica is not None and replica_allowed(
+                self.app, request.method, request.cookies.get(STICKY_COOKIE)):
+            request.database = self.replica
+        stats = RequestStats()
+        try:
+            status, payload, tag = await handler(request, stats)
+        except Exception:
+            self.app.logger.exception('%s %s failed', scope['method'], scope['path'])
+            status, payload, tag = error(500)
+        report(self.app, stats, endpoint, request.method, request.path, status)
+        headers = [(b'server-timing', stats.server_timing().encode())] + CORS_HEADERS
+        policy = self.app.config['CACHE_CONTROL'].get(endpoint)
+        if policy:
+            headers.append((b'cache-control', policy.encode()))
+        if tag is not None:
+            headers.append((b'etag', quote_etag(tag).encode()))
+        content = b''
+        if payload is not None:
+            content = dumps(payload)
+            headers.append((b'content-type', b'application/json'))
+        headers.append((b'content-length', str(len(content)).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def fetch(self, request, stats, name, statement):
+        start = time.perf_counter()
+        rows = await request.database.fetch(statement)
+        stats.add(name, time.perf_counter() - start)
+        return rows
+
+    async def sync(self, request, stats):
+        generation = cache.sync_due(self.app.config['TABLE_VERSION_CHECK_SECONDS'])
+        if generation is not None:
+            rows = await self.fetch(request, stats, 'table versions', cache.versions_statement())
+            cache.apply_versions([(row['name'], row['version']) for row in rows], generation)
+
+    async def question_ids(self, request, stats, category):
+        ids, generation = cache.lookup_ids(category)
+        if ids is None:
+            rows = await self.fetch(request, stats, 'question ids', cache.ids_statement(category))
+            ids = tuple(row['id'] for row in rows)
+            cache.store_ids(category, generation, ids)
+        return ids
+
+    async def questions(self, request, stats):
+        await self.sync(request, stats)
+        tag = etag('questions', cache.version('questions'))
+        if request.not_modified(tag):
+            return 304, None, tag
+        try:
+            page, current_category, search_term = views.question_args(request.query)
+        except Exception:
+            return error(422)
+
+        # no await in between: the app context must not span a task switch
+        with self.app.app_context():
+            query = views.questions_query(current_category, search_term)
+            count = query.order_by(None).with_entities(func.count(Question.id)).statement
+        total_questions, generation = cache.lookup_count(current_category, search_term)
+        if total_questions is None:
+            rows = await self.fetch(request, stats, 'question count', count)
+            total_questions = next(iter(rows[0].values()))
+            cache.store_count(current_category, search_term, generation, total_questions)
+        page = views.page_of(total_questions, page)
+        statement = query.offset((page - 1) * QUESTIONS_PER_PAGE) \
+            .limit(QUESTIONS_PER_PAGE).statement
+        questions = await self.fetch(request, stats, 'question page', statement)
+        return 200, {
+            'questions': questions,
+            'total_questions': total_questions,
+            'page': page,
+            'message': 'OK'
+        }, tag
+
+    async def categories(self, request, stats):
+        await self.sync(request, stats)
+        tag = etag('categories', cache.version('categories'))
+        if request.not_modified(tag):
+            return 304, None, tag
+        statement = select([Category.__table__]).order_by(Category.id)
+        categories = await self.fetch(request, stats, 'categories', statement)
+        return 200, {'message': 'OK', 'categories': categories}, tag
+
+    async def quizzes(self, request, stats):
+        try:
+            f = request.json()
+            previous_questions = set(f['previous_questions'])
+            quiz_category = int(f['category'])
+        except (ValueError, TypeError, KeyError):
+            return error(422)
+        category = None if quiz_category == -1 else quiz_category
+
+        await self.sync(request, stats)
+        question = None
+        for _ in range(2):
+            ids = await self.question_ids(request, stats, category)
+            question_id = views.random_question_id(ids, previous_questions)
+            if question_id is None:
+                break
+            rows = await self.fetch(request, stats, 'question', select([Question.__table__])
+                                    .where(Question.id == question_id))
+            if rows:
+                question = rows[0]
+                break
+            # Deleted by another process since the ids were cached.
+            cache.invalidate_questions()
+        return 200, {'message': 'OK', 'question': question}, None
+
+    def run_wsgi(self, environ):
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [int(status.split(' ', 1)[0]), headers]
+
+        result = self.app(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started[0], started[1], content
+
+    async def call_flask(self, scope, body, send):
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(
+            self.wsgi_executor, self.run_wsgi, wsgi_environ(scope, body))
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(k.lower().encode('latin1'), v.encode('latin1'))
+                                for k, v in headers]})
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.database.close()
+                if self.replica is not None:
+                    await self.replica.close()
+                self.wsgi_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def error(status):
+    return status, {'error': status, 'message': ERROR_MESSAGES[status]}, None
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin1'), value.decode('latin1')
+        if name == 'content-length':
+            continue
+        key = 'CONTENT_TYPE' if name == 'content-type' else 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+async def request(app, method, url, body=None, headers=()):
+    """
+    Calls the ASGI `app` directly, without a server; returns (status,
+    {header: value}, body bytes). `body` is sent as JSON.
+    """
+    parts = urlsplit(url)
+    content = b'' if body is None else json.dumps(body).encode()
+    headers = [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]
+    if body is not None:
+        headers.append((b'content-type', b'application/json'))
+    scope = {
+        'type': 'http', 'method': method, 'path': parts.path, 'root_path': '',
+        'query_string': parts.query.encode('latin1'), 'headers': headers,
+        'http_version': '1.1', 'scheme': 'http',
+    }
+    messages = [{'type': 'http.request', 'body': content, 'more_body': False}]
+    response = {'body': b''}
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {k.decode('latin1'): v.decode('latin1')
+                                   for k, v in message['headers']}
+        else:
+            response['body'] += message.get('body', b'')
+
+    await app(scope, receive, send)
+    return response['status'], response['headers'], response['body']
+
+
+def create_asgi_app(test_config=None):
+    return AsyncApp(create_app(test_config))
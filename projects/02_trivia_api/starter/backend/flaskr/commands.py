@@ -0,0 +1,156 @@
+"""
+Bulk import and export of questions and categories as JSON lines.
+
+    flask questions export questions.jsonl
+    flask questions import questions.jsonl --chunk-size 1000
+    flask categories export categories.jsonl
+    flask seed-data --questions 1000000 --seed 7
+
+Exports read through a server-side cursor and imports insert one chunk
+per transaction with executemany, so memory stays flat whatever the
+size of the file. `seed-data` adds synthetic rows from datagen.py.
+"""
+import json
+
+import click
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+import datagen
+from models import Question, Category, bump_version, db
+from .main import cache
+
+
+def export_rows(model, out, batch_size=1000):
+    """Writes every row of `model` to `out`, one JSON object per line."""
+    table = model.__table__
+    query = select([table]).order_by(table.c.id) \
+        .execution_options(stream_results=True, max_row_buffer=batch_size)
+    result = db.session.execute(query)
+    count = 0
+    while True:
+        rows = result.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            out.write(json.dumps(dict(row)) + '\n')
+        count += len(rows)
+    result.close()
+    return count
+
+
+def validate(model, row, keep_ids):
+    """The column values of `row`, checked by the model's constructor."""
+    values = {k: v for k, v in row.items() if k != 'id'}
+    obj = model(**values)
+    checked = {c.name: getattr(obj, c.name) for c in model.__table__.columns
+               if c.name != 'id'}
+    if keep_ids and 'id' in row:
+        checked['id'] = int(row['id'])
+    return checked
+
+
+def import_rows(model, source, chunk_size=500, keep_ids=False):
+    """
+    Inserts the JSON lines of `source` into `model`'s table, one chunk per
+    transaction; a chunk the database rejects is retried row by row, so
+    that only the bad rows are left out. Returns (imported, [(line
+    number, error)]).
+    """
+    table = model.__table__
+    imported, errors, chunk = 0, [], []
+
+    def insert(rows):
+        db.session.execute(table.insert(), rows)
+        bump_version(table.name)
+        db.session.commit()
+
+    def flush():
+        nonlocal imported
+        try:
+            insert([values for _, values in chunk])
+            imported += len(chunk)
+        except SQLAlchemyError:
+            db.session.rollback()
+            # isolate the rows the database refuses
+            for number, values in chunk:
+                try:
+                    insert([values])
+                    imported += 1
+                except SQLAlchemyError as e:
+                    db.session.rollback()
+                    errors.append((number, str(getattr(e, 'orig', e))))
+        chunk.clear()
+
+    for number, line in enumerate(source, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            chunk.append((number, validate(model, row, keep_ids)))
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append((number, str(e)))
+            continue
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    if keep_ids and db.engine.dialect.name == 'postgresql':
+        # explicit ids do not advance the sequence
+        db.session.execute(text(
+            "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+            "COALESCE((SELECT max(id) FROM {0}), 1))".format(table.name)))
+        db.session.commit()
+    return imported, errors
+
+
+def make_group(name, model):
+    group = AppGroup(name, help='Bulk import/export of {} as JSON lines.'.format(name))
+
+    @group.command('export')
+    @click.argument('target', type=click.File('w', encoding='utf-8'), default='-')
+    @click.option('--batch-size', default=1000, show_default=True,
+                  help='Rows fetched from the cursor at a time.')
+    def export_command(target, batch_size):
+        """Writes every row to TARGET (stdout by default)."""
+        count = export_rows(model, target, batch_size)
+        click.echo('{} {} exported'.format(count, name), err=True)
+
+    @group.command('import')
+    @click.argument('source', type=click.File('r', encoding='utf-8'))
+    @click.option('--chunk-size', default=500, show_default=True,
+                  help='Rows inserted per transaction.')
+    @click.option('--keep-ids', is_flag=True,
+                  help='Insert the ids found in SOURCE instead of new ones.')
+    def import_command(source, chunk_size, keep_ids):
+        """Inserts the rows of SOURCE ('-' for stdin)."""
+        imported, errors = import_rows(model, source, chunk_size, keep_ids)
+        if model is Question:
+            cache.invalidate_questions()
+        else:
+            cache.invalidate_categories()
+        for number, message in errors:
+            click.echo('line {}: {}'.format(number, message), err=True)
+        click.echo('{} {} imported, {} errors'.format(imported, name, len(errors)))
+
+    return group
+
+
+questions_cli = make_group('questions', Question)
+categories_cli = make_group('categories', Category)
+
+
+@click.command('seed-data')
+@click.option('--questions', default=10000, show_default=True)
+@click.option('--categories', default=len(datagen.CATEGORIES), show_default=True)
+@click.option('--seed', default=0, show_default=True)
+@with_appcontext
+def seed_data(questions, categories, seed):
+    """Adds deterministic synthetic categories and questions."""
+    written, _, _ = datagen.generate(questions, categories, seed)
+    cache.invalidate_categories()
+    cache.invalidate_questions()
+    for table, count in written.items():
+        click.echo('{:<12} {:>10}'.format(table, count))
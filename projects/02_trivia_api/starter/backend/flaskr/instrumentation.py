@@ -0,0 +1,158 @@
+"""
+Per-request SQL instrumentation.
+
+Every statement run on any engine during a request is timed. When the
+request ends its statement count, total database time and slowest
+statement are sent as a Server-Timing header and logged as one JSON line
+(at WARNING when the database time reaches SLOW_REQUEST_DB_MS, DEBUG
+otherwise).
+
+Views may declare how many statements they are allowed:
+
+    @app.route('/categories')
+    @query_budget(2)
+    def category_list(): ...
+
+A request over budget is logged, and raises QueryBudgetExceeded when
+QUERY_BUDGET_STRICT is set, which the test suite does. `report()` does
+the logging and the check for requests served outside Flask
+(flaskr/asgi.py). `QueryCounter` counts statements inside a `with` block.
+"""
+import json
+import logging
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOWEST_STATEMENT_CHARS = 200
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_statement = None
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds >= self.slowest:
+            self.slowest = seconds
+            self.slowest_statement = statement
+
+    def server_timing(self):
+        return 'db;dur={:.2f};desc="{} queries", db-slowest;dur={:.2f}'.format(
+            self.total * 1000, self.count, self.slowest * 1000)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if has_request_context():
+        stats = g.get('db_stats')
+        if stats is not None:
+            stats.add(statement, elapsed)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _drop_timer(context):
+    starts = context.connection.info.get('query_start') if context.connection else None
+    if starts:
+        starts.pop()
+
+
+def query_budget(n):
+    """Declares that a view runs at most `n` statements per request."""
+    def decorator(view):
+        view.query_budget = n
+        return view
+    return decorator
+
+
+def _start_request():
+    g.db_stats = RequestStats()
+
+
+def _finish_request(response):
+    stats = g.pop('db_stats', None)
+    if stats is None:
+        return response
+    response.headers.add('Server-Timing', stats.server_timing())
+    report(current_app, stats, request.endpoint, request.method, request.path,
+           response.status_code)
+    return response
+
+
+def report(app, stats, endpoint, method, path, status):
+    """
+    Logs the statements of a finished request and checks them against
+    the budget of the view of `endpoint`.
+    """
+    config = app.config
+    view = app.view_functions.get(endpoint)
+    budget = getattr(view, 'query_budget', None)
+    over_budget = budget is not None and stats.count > budget
+    slow = stats.total * 1000 >= config.get('SLOW_REQUEST_DB_MS', 100)
+    record = {
+        'method': method,
+        'path': path,
+        'endpoint': endpoint,
+        'status': status,
+        'queries': stats.count,
+        'db_ms': round(stats.total * 1000, 3),
+        'slowest_ms': round(stats.slowest * 1000, 3),
+        'slowest_statement': (stats.slowest_statement or '')[:SLOWEST_STATEMENT_CHARS],
+    }
+    if over_budget:
+        record['query_budget'] = budget
+    level = logging.WARNING if slow or over_budget else logging.DEBUG
+    app.logger.log(level, json.dumps(record))
+
+    if over_budget and config.get('QUERY_BUDGET_STRICT'):
+        raise QueryBudgetExceeded('{} ran {} statements, its budget is {}'.format(
+            endpoint, stats.count, budget))
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+class QueryCounter:
+    """
+    Counts the statements sent to `engine` (every engine by default)
+    inside a `with` block; `statements` lists them as (statement,
+    parameters) pairs.
+    """
+
+    def __init__(self, engine=Engine):
+        self.engine = engine
+        self.count = 0
+        self.statements = []
+
+    def _count(self, conn, cursor, statement, parameters, *args):
+        self.count += 1
+        self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
@@ -0,0 +1,169 @@
+"""
+Process-local caches derived from the questions table.
+
+Everything here is dropped by `invalidate_questions()`, which the views
+call after every successful insert or delete of a question.
+
+Writes from other processes are seen through the `table_versions` row
+each write bumps in its own transaction (models.TableVersion): `sync()`
+reads the versions at most once per TABLE_VERSION_CHECK_SECONDS, so a
+process serves data another one changed for no longer than that. The
+versions are also what the ETags of the API carry, which makes a tag
+valid in every process.
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from models import Question, TableVersion, db
+
+MAX_CACHED_COUNTS = 1024
+
+_lock = Lock()
+_generation = 0
+_question_counts = OrderedDict()
+_category_ids = {}
+# shared table versions as last read, and when (time.monotonic())
+_versions = {}
+_checked_at = None
+
+
+def lookup_count(category, search):
+    """(cached count or None, generation to pass to `store_count`)."""
+    key = (category, search)
+    with _lock:
+        if key in _question_counts:
+            _question_counts.move_to_end(key)
+            return _question_counts[key], _generation
+        return None, _generation
+
+
+def store_count(category, search, generation, total):
+    with _lock:
+        # Don't store a count that raced with an insert or delete.
+        if generation != _generation:
+            return
+        _question_counts[(category, search)] = total
+        if len(_question_counts) > MAX_CACHED_COUNTS:
+            _question_counts.popitem(last=False)
+
+
+def question_count(query, category, search):
+    """
+    COUNT of `query` (questions filtered by `category` and `search`),
+    remembered per (category, search) pair until the next invalidation,
+    in this process or (through the shared version) in another one.
+    """
+    total, generation = lookup_count(category, search)
+    if total is None:
+        total = query.order_by(None).with_entities(func.count(Question.id)).scalar()
+        store_count(category, search, generation, total)
+    return total
+
+
+def lookup_ids(category):
+    """(cached ids or None, generation to pass to `store_ids`)."""
+    with _lock:
+        return _category_ids.get(category), _generation
+
+
+def store_ids(category, generation, ids):
+    with _lock:
+        if generation == _generation:
+            _category_ids[category] = ids
+
+
+def ids_statement(category):
+    """SELECT of the ids of the questions in `category`, in id order."""
+    statement = select([Question.id]).order_by(Question.id)
+    if category is not None:
+        statement = statement.where(Question.category == category)
+    return statement
+
+
+def question_ids(category):
+    """
+    Tuple of the ids of the questions in `category` (every question for
+    None), loaded with one id-only query and kept until the next
+    invalidation, here or in another process.
+    """
+    ids, generation = lookup_ids(category)
+    if ids is None:
+        ids = tuple(i for i, in db.session.execute(ids_statement(category)))
+        store_ids(category, generation, ids)
+    return ids
+
+
+def versions_statement():
+    return select([TableVersion.name, TableVersion.version])
+
+
+def sync_due(interval):
+    """
+    None if the shared versions were read less than `interval` seconds
+    ago, else the generation to pass to `apply_versions`.
+    """
+    with _lock:
+        if _checked_at is not None and time.monotonic() - _checked_at < interval:
+            return None
+        return _generation
+
+
+def apply_versions(rows, generation):
+    """
+    Takes the (name, version) `rows` of `versions_statement()` and drops
+    what another process has made stale.
+    """
+    global _generation, _checked_at
+    versions = dict(rows)
+    with _lock:
+        # Read before a write of this process: the next request reads again.
+        if generation != _generation:
+            return
+        if versions.get('questions') != _versions.get('questions'):
+            _generation += 1
+            _question_counts.clear()
+            _category_ids.clear()
+        _versions.update(versions)
+        _checked_at = time.monotonic()
+
+
+def sync():
+    generation = sync_due(current_app.config['TABLE_VERSION_CHECK_SECONDS'])
+    if generation is not None:
+        apply_versions(db.session.execute(versions_statement()).fetchall(), generation)
+
+
+def version(name):
+    """The shared version of table `name` as last read by `sync`."""
+    return _versions.get(name)
+
+
+def questions_version():
+    sync()
+    return version('questions')
+
+
+def categories_version():
+    sync()
+    return version('categories')
+
+
+def invalidate_categories():
+    global _generation, _checked_at
+    with _lock:
+        # the next `sync` reads the versions whatever the interval
+        _generation += 1
+        _checked_at = None
+
+
+def invalidate_questions():
+    global _generation, _checked_at
+    with _lock:
+        _generation += 1
+        _checked_at = None
+        _question_counts.clear()
+        _category_ids.clear()
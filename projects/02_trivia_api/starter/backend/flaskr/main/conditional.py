@@ -0,0 +1,42 @@
+"""
+Conditional GET for the JSON API.
+
+ETags are derived from the shared table versions in `cache`, not from
+the response body: a request whose If-None-Match carries the current
+tag is answered with an empty 304 before the view queries or serializes
+anything. The versions are kept in the database, so a tag stays valid
+across processes and restarts; a process only rereads them every
+TABLE_VERSION_CHECK_SECONDS, which bounds how long it may answer 304
+for a table another process has changed.
+"""
+import functools
+
+from flask import current_app, make_response, request
+
+
+def etag(name, version):
+    return '{}-{}'.format(name, version)
+
+
+def conditional(name, version):
+    """
+    Adds a strong ETag to the 200 responses of a view and answers 304 to a
+    matching If-None-Match. `version` returns the current version of the
+    table the view reads.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # Read the version first: a write racing with the view makes the
+            # tag older than the body, which only costs a 200 next time.
+            tag = etag(name, version())
+            if request.if_none_match.contains(tag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,154 @@
+"""
+Server-side quiz sessions.
+
+A session is the shuffled ids of the questions eligible for a quiz,
+drawn once when it starts; each next question pops the first id, so the
+request carries no history and costs O(1) whatever the length of the
+quiz. Sessions expire QUIZ_SESSION_TTL seconds after their last use.
+
+The store comes from QUIZ_SESSION_STORE: 'memory' keeps sessions in this
+process (at most QUIZ_SESSION_LIMIT of them, the least recently used are
+dropped first), so it needs a single worker process or sticky sessions
+at the load balancer; a redis:// URL shares them between processes.
+"""
+import itertools
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+
+from flask import current_app
+
+
+class MemoryStore:
+
+    def __init__(self, max_sessions=10000):
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def create(self, key, ids, ttl):
+        with self._lock:
+            self._sessions[key] = (time.monotonic() + ttl, deque(ids))
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def pop(self, key, ttl):
+        """(next id or None when the quiz ran out, ids left); KeyError if unknown."""
+        now = time.monotonic()
+        with self._lock:
+            expires, ids = self._sessions[key]
+            if expires <= now:
+                del self._sessions[key]
+                raise KeyError(key)
+            self._sessions[key] = (now + ttl, ids)
+            self._sessions.move_to_end(key)
+            return (ids.popleft() if ids else None), len(ids)
+
+    def peek(self, key, start, count):
+        """Up to `count` of the ids left from `start` on, in order; KeyError if unknown."""
+        with self._lock:
+            return list(itertools.islice(self._sessions[key][1], start, start + count))
+
+    def drop(self, key, count):
+        """Removes the first `count` ids left."""
+        with self._lock:
+            ids = self._sessions[key][1]
+            for _ in range(min(count, len(ids))):
+                ids.popleft()
+
+    def delete(self, key):
+        with self._lock:
+            return self._sessions.pop(key, None) is not None
+
+
+class RedisStore:
+    """
+    Shared store; needs the `redis` package. The ids are a list popped
+    from the left, next to a marker key that tells a finished quiz from
+    an unknown one (redis drops empty lists).
+    """
+
+    def __init__(self, url, prefix='trivia:quiz:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def create(self, key, ids, ttl):
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, len(ids), ex=ttl)
+        if ids:
+            pipe.rpush(self.prefix + key + ':ids', *ids)
+            pipe.expire(self.prefix + key + ':ids', ttl)
+        pipe.execute()
+
+    def pop(self, key, ttl):
+        pipe = self.client.pipeline()
+        pipe.lpop(self.prefix + key + ':ids')
+        pipe.llen(self.prefix + key + ':ids')
+        pipe.expire(self.prefix + key, ttl)
+        pipe.expire(self.prefix + key + ':ids', ttl)
+        question_id, remaining, exists, _ = pipe.execute()
+        if not exists:
+            raise KeyError(key)
+        return (int(question_id) if question_id is not None else None), remaining
+
+    def peek(self, key, start, count):
+        pipe = self.client.pipeline()
+        pipe.exists(self.prefix + key)
+        pipe.lrange(self.prefix + key + ':ids', start, start + count - 1)
+        exists, ids = pipe.execute()
+        if not exists:
+            raise KeyError(key)
+        return [int(i) for i in ids]
+
+    def drop(self, key, count):
+        if count:
+            self.client.ltrim(self.prefix + key + ':ids', count, -1)
+
+    def delete(self, key):
+        return bool(self.client.delete(self.prefix + key, self.prefix + key + ':ids'))
+
+
+def make_store(name, max_sessions):
+    if name == 'memory':
+        return MemoryStore(max_sessions)
+    if name.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(name)
+    raise ValueError('unknown QUIZ_SESSION_STORE {!r}'.format(name))
+
+
+_lock = threading.Lock()
+_stores = {}
+
+
+def store():
+    name = current_app.config['QUIZ_SESSION_STORE']
+    with _lock:
+        if name not in _stores:
+            _stores[name] = make_store(name, current_app.config['QUIZ_SESSION_LIMIT'])
+        return _stores[name]
+
+
+def create(ids):
+    """Starts a session over `ids` (already shuffled); returns its id."""
+    key = secrets.token_urlsafe(16)
+    store().create(key, ids, current_app.config['QUIZ_SESSION_TTL'])
+    return key
+
+
+def pop(key):
+    return store().pop(key, current_app.config['QUIZ_SESSION_TTL'])
+
+
+def peek(key, start, count):
+    return store().peek(key, start, count)
+
+
+def drop(key, count):
+    store().drop(key, count)
+
+
+def delete(key):
+    return store().delete(key)
@@ -0,0 +1,86 @@
+"""
+Question search.
+
+A backend turns a query, the searched column and the user's term into a
+filtered query ordered by relevance. `get_search_backend()` picks one
+from the SEARCH_BACKEND setting; "auto" (the default) uses the index that
+`models.setup_search_index()` created for the current database.
+"""
+from flask import current_app
+from sqlalchemy import bindparam, column, func, literal_column, table
+
+from models import db
+
+
+class IlikeSearch:
+    """Case-insensitive substring match; works everywhere, indexes nothing."""
+
+    def search(self, query, col, term):
+        return query.filter(col.ilike('%{}%'.format(term))) \
+            .order_by(col.class_.id)
+
+
+class TrigramSearch(IlikeSearch):
+    """
+    PostgreSQL with pg_trgm: the GIN trigram index serves the same ILIKE
+    filter, and results are ranked by trigram similarity to the term.
+    """
+
+    def search(self, query, col, term):
+        return query.filter(col.ilike('%{}%'.format(term))) \
+            .order_by(func.similarity(col, term).desc(), col.class_.id)
+
+
+class Fts5Search(IlikeSearch):
+    """
+    SQLite with the FTS5 trigram tables `<table>_fts`, ranked by bm25.
+    Terms shorter than a trigram cannot be looked up in the index and
+    fall back to ILIKE, as does every term where the table is missing:
+    SQLite before 3.34 has no trigram tokenizer, and
+    `models.setup_search_index()` creates no FTS5 tables there.
+    """
+
+    def search(self, query, col, term):
+        name = col.class_.__tablename__ + '_fts'
+        if len(term) < 3 or name not in fts_tables():
+            return super().search(query, col, term)
+        fts = table(name, column('rowid'), column('rank'))
+        phrase = '"{}"'.format(term.replace('"', '""'))
+        return query.join(fts, fts.c.rowid == col.class_.id) \
+            .filter(literal_column(fts.name).op('MATCH')(bindparam('term', phrase))) \
+            .order_by(fts.c.rank, col.class_.id)
+
+
+_fts_tables = {}
+
+
+def fts_tables():
+    """Names of the FTS5 tables of the current database, read once per engine."""
+    engine = db.engine
+    if engine not in _fts_tables:
+        _fts_tables[engine] = {t for t in engine.table_names() if t.endswith('_fts')}
+    return _fts_tables[engine]
+
+
+def init_app(app):
+    # First-request hooks run before the statements of a request are
+    # counted, so the table names stay out of the views' budgets.
+    app.before_first_request(fts_tables)
+
+
+backends = {
+    'ilike': IlikeSearch,
+    'postgresql': TrigramSearch,
+    'sqlite': Fts5Search,
+}
+
+
+def get_search_backend():
+    name = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        name = db.engine.dialect.name
+    return backends.get(name, IlikeSearch)()
+
+
+def search(query, col, term):
+    return get_search_backend().search(query, col, term)
@@ -1,78 +1,102 @@
+import random
+
 from flask import request, jsonify, abort
 
+import pooling
 from flaskr import QUESTIONS_PER_PAGE
 from models import Question, Category, db
 from . import main as app
+from . import cache, quiz_sessions
+from .conditional import conditional
+from ..instrumentation import query_budget
+from ..streaming import STREAM_BATCH_SIZE, stream_json
+from .search import search
 
+# queued ids checked per query when a session skips deleted questions
+QUIZ_SKIP_WINDOW = 50
 
-@app.route('/questions', methods=['GET'])
-def question_list():
 
-    f = request.values
+def question_args(f):
+    """(page, current_category, search_term) of the question list request."""
+    if 'page' in f and f['page']:
+        page = int(f['page'])
+    else:
+        page = 1
+    if 'current_category' in f and f['current_category'] != 'null':
+        current_category = int(f['current_category'])
+        assert current_category > 0
+    else:
+        current_category = None
+    if 'search_term' in f and f['search_term']:
+        search_term = f['search_term']
+    else:
+        search_term = ''
+    return page, current_category, search_term
+
+
+def questions_query(current_category, search_term):
     query = Question.query
+    if current_category:
+        query = query.filter_by(category=current_category)
+    if search_term:
+        return search(query, Question.question, search_term)
+    return query.order_by(Question.id)
+
+
+def page_of(total_questions, page):
+    max_page = total_questions // QUESTIONS_PER_PAGE + \
+        (1 if total_questions % QUESTIONS_PER_PAGE > 0 else 0)
+    return 1 if page > max_page or page < 1 else page
 
+
+@app.route('/questions', methods=['GET'])
+# the table versions, when due, the count, when not cached, and the page
+@query_budget(3)
+@conditional('questions', cache.questions_version)
+def question_list():
     try:
-        if 'page' in f and f['page']:
-            page = int(f['page'])
-        else:
-            page = 1
-        if 'current_category' in f and f['current_category'] != 'null':
-            current_category = int(f['current_category'])
-            assert current_category > 0
-        else:
-            current_category = None
-        if 'search_term' in f and f['search_term']:
-            search = "%{}%".format(f['search_term'])
-        else:
-            search = ''
+        page, current_category, search_term = question_args(request.values)
     except Exception:
         abort(422)
         return
 
     try:
-        if search:
-            query = query.filter(Question.question.ilike(search))
-        if current_category:
-            query = query.filter_by(category=current_category)
-
-        questions = query.all()
-        total_questions = len(questions)
-        max_page = total_questions // QUESTIONS_PER_PAGE + \
-            (1 if total_questions % QUESTIONS_PER_PAGE > 0 else 0)
-        if page > max_page or page < 1:
-            page = 1
-        questions = questions[(page - 1) *
-                              QUESTIONS_PER_PAGE: page * QUESTIONS_PER_PAGE]
+        query = questions_query(current_category, search_term)
+        total_questions = cache.question_count(query, current_category, search_term)
+        page = page_of(total_questions, page)
+        questions = query.offset((page - 1) * QUESTIONS_PER_PAGE) \
+            .limit(QUESTIONS_PER_PAGE)
 
-        return jsonify({
-            'questions': [q.format() for q in questions],
+        return stream_json({
             'total_questions': total_questions,
             'page': page,
             'message': 'OK'
-        }), 200
+        }, 'questions', (q.format() for q in questions))
     except Exception:
         abort(500)
 
 
 @app.route('/categories', methods=['GET'])
+@query_budget(2)
+@conditional('categories', cache.categories_version)
 def category_list():
     """
     :return: `categories`
     """
-    categories = Category.query.order_by('id').all()
-    return jsonify({
-        'message': 'OK',
-        'categories': [c.format() for c in categories]
-    }), 200
+    categories = Category.query.order_by('id').yield_per(STREAM_BATCH_SIZE)
+    return stream_json({'message': 'OK'}, 'categories', (c.format() for c in categories))
 
 
 @app.route('/questions/<int:id>', methods=['DELETE'])
+# the question, its delete and the version bump
+@query_budget(3)
 def question_delete(id):
     to_delete = Question.query.get(id)
     if to_delete is None:
         abort(404)
     try:
         to_delete.delete()  # delete and commit
+        cache.invalidate_questions()
         return jsonify({
             'message': 'OK'
         }), 200
@@ -82,6 +106,7 @@ def question_delete(id):
 
 
 @app.route('/questions', methods=['POST'])
+@query_budget(2)
 def question_create():
     f = request.get_json()
     try:
@@ -94,6 +119,7 @@ def question_create():
         return
     try:
         q.insert()
+        cache.invalidate_questions()
         return jsonify({
             'message': 'Created'
         }), 201
@@ -102,20 +128,131 @@ def question_create():
         abort(500)
 
 
+@app.route('/health', methods=['GET'])
+@query_budget(1)
+def health():
+    """
+    :return: database round trip and connection pool counters
+    """
+    body, status = pooling.health(db.engine)
+    return jsonify(body), status
+
+
+def random_question_id(ids, excluded):
+    """
+    A random member of `ids` that is not in `excluded` (a set), or None.
+    Draws are O(1) while most of the ids are still eligible; once the
+    quiz has used up half of them the remaining ones are listed instead.
+    """
+    if len(excluded) * 2 < len(ids):
+        while True:
+            candidate = random.choice(ids)
+            if candidate not in excluded:
+                return candidate
+    eligible = [i for i in ids if i not in excluded]
+    return random.choice(eligible) if eligible else None
+
+
 @app.route('/quizzes', methods=['POST'])
+# the table versions (when due), ids (when not cached) and the question,
+# twice if it was deleted meanwhile
+@query_budget(5)
 def quiz_get_next():
-    import random
     f = request.get_json()
-    previous_questions = f['previous_questions']
+    previous_questions = set(f['previous_questions'])
     quiz_category = int(f['category'])
-    query = Question.query
-    if quiz_category != -1:
-        query = query.filter_by(category=quiz_category)
-    quiz_list = query.all()
-    quiz_list = [q for q in quiz_list if q.id not in previous_questions]
+    category = None if quiz_category == -1 else quiz_category
+
+    cache.sync()
+    question = None
+    question_id = random_question_id(cache.question_ids(category), previous_questions)
+    if question_id is not None:
+        question = Question.query.get(question_id)
+        if question is None:
+            # Deleted by another process since the ids were cached.
+            cache.invalidate_questions()
+            question_id = random_question_id(cache.question_ids(category), previous_questions)
+            if question_id is not None:
+                question = Question.query.get(question_id)
 
     return jsonify({
         'message': 'OK',
-        'question': None if not quiz_list
-        else random.choice(quiz_list).format(),
+        'question': None if question is None else question.format(),
+    }), 200
+
+
+@app.route('/quizzes/sessions', methods=['POST'])
+# the table versions, when due, and the ids, when not cached
+@query_budget(2)
+def quiz_session_create():
+    """
+    Starts a quiz over the questions of `category` (-1 for all) in a
+    random order drawn once.
+    :return: `session_id`, `total_questions`
+    """
+    f = request.get_json(silent=True) or {}
+    try:
+        quiz_category = int(f.get('category', -1))
+    except (TypeError, ValueError):
+        abort(422)
+        return
+    category = None if quiz_category == -1 else quiz_category
+
+    cache.sync()
+    ids = list(cache.question_ids(category))
+    random.shuffle(ids)
+    return jsonify({
+        'message': 'Created',
+        'session_id': quiz_sessions.create(ids),
+        'total_questions': len(ids),
+    }), 201
+
+
+@app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+# the question; if it was deleted since the quiz started, the questions
+# left, QUIZ_SKIP_WINDOW ids at a time: each further window of deleted
+# questions costs one more statement
+@query_budget(3)
+def quiz_session_next(session_id):
+    """
+    :return: the next `question` of the session, None once it ran out,
+        and the number of questions `remaining`
+    """
+    try:
+        question_id, remaining = quiz_sessions.pop(session_id)
+    except KeyError:
+        abort(404)
+        return
+    question = None if question_id is None else Question.query.get(question_id)
+    if question_id is not None and question is None:
+        # Skip every id deleted meanwhile, a window of them per query.
+        skipped = 0
+        while question is None and skipped < remaining:
+            ids = quiz_sessions.peek(session_id, skipped, QUIZ_SKIP_WINDOW)
+            if not ids:
+                break
+            found = {q.id: q for q in Question.query.filter(Question.id.in_(ids))}
+            live = next((n for n, i in enumerate(ids) if i in found), None)
+            if live is None:
+                skipped += len(ids)
+            else:
+                question = found[ids[live]]
+                skipped += live + 1
+        quiz_sessions.drop(session_id, skipped)
+        remaining = max(remaining - skipped, 0)
+
+    return jsonify({
+        'message': 'OK',
+        'question': None if question is None else question.format(),
+        'remaining': remaining,
+    }), 200
+
+
+@app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+@query_budget(0)
+def quiz_session_delete(session_id):
+    if not quiz_sessions.delete(session_id):
+        abort(404)
+    return jsonify({
+        'message': 'OK'
     }), 200
@@ -0,0 +1,61 @@
+"""
+Streamed JSON for the list endpoints.
+
+    return stream_json({'message': 'OK'}, 'categories',
+                       (c.format() for c in query.yield_per(500)))
+
+The items of `rows` are encoded one at a time (with orjson when it is
+installed) and never collected into a list. Up to STREAM_JSON_THRESHOLD
+items the body is sent in one piece; past it the response is streamed
+in chunks of STREAM_JSON_CHUNK_BYTES while the rows come from the
+cursor. The status line is sent with the first chunk, so an error after
+it can only cut the body short.
+"""
+import itertools
+import json
+
+from flask import current_app, stream_with_context
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# rows fetched from a server-side cursor at a time
+STREAM_BATCH_SIZE = 500
+
+
+def dumps(value):
+    """`value` as UTF-8 encoded JSON."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+def json_chunks(fields, key, rows, chunk_bytes=65536):
+    """The object `fields` with the list `rows` added under `key`, in chunks."""
+    envelope = dumps(dict(fields, **{key: []}))
+    # the list is the last member, so the envelope ends with b'[]}'
+    buffer = bytearray(envelope[:-2])
+    for i, row in enumerate(rows):
+        if i:
+            buffer += b','
+        buffer += dumps(row)
+        if len(buffer) >= chunk_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += envelope[-2:]
+    yield bytes(buffer)
+
+
+def stream_json(fields, key, rows):
+    config = current_app.config
+    threshold = config.get('STREAM_JSON_THRESHOLD', 1000)
+    chunk_bytes = config.get('STREAM_JSON_CHUNK_BYTES', 65536)
+    rows = iter(rows)
+    head = list(itertools.islice(rows, threshold + 1))
+    if len(head) <= threshold:
+        return current_app.response_class(
+            b''.join(json_chunks(fields, key, head, chunk_bytes)), mimetype='application/json')
+    chunks = json_chunks(fields, key, itertools.chain(head, rows), chunk_bytes)
+    return current_app.response_class(stream_with_context(chunks), mimetype='application/json')
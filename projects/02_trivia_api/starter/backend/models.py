@@ -1,10 +1,15 @@
-from flask_sqlalchemy import SQLAlchemy
+import os
+
 from sqlalchemy import Column, Integer
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+import pooling
+from replica import RoutingSQLAlchemy
 
 database_name = "trivia"
-database_path = "postgres://postgres@{}/{}".format(
-    'localhost:5432', database_name)
-db = SQLAlchemy()
+database_path = os.environ.get('DATABASE_URL', "postgres://postgres@{}/{}".format(
+    'localhost:5432', database_name))
+db = RoutingSQLAlchemy()
 
 
 def setup_db(app, database_path=database_path):
@@ -13,11 +18,115 @@ def setup_db(app, database_path=database_path):
     """
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = pooling.engine_options(
+        app.config, database_path)
     db.app = app
     db.init_app(app)
     return db
 
 
+def setup_indexes():
+    """
+    creates the indexes declared on the models that an existing database
+    (e.g. one restored from trivia.psql) is missing; create_all only
+    creates them along with new tables
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            db.session.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(
+                index.name, table.name, ', '.join(c.name for c in index.columns)))
+    db.session.commit()
+
+
+def fts5_trigram():
+    """whether SQLite has FTS5 with the trigram tokenizer (3.34+)"""
+    try:
+        db.session.execute(
+            "CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x, tokenize='trigram')")
+    except DBAPIError:
+        db.session.rollback()
+        return False
+    db.session.execute('DROP TABLE temp.fts5_probe')
+    return True
+
+
+def setup_search_index():
+    """
+    creates the index behind question search when it is missing:
+    a pg_trgm GIN index on PostgreSQL, an FTS5 trigram table kept in
+    sync by triggers on SQLite when it has the trigram tokenizer
+    (search falls back to ILIKE otherwise)
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        db.session.execute(
+            'CREATE INDEX IF NOT EXISTS ix_questions_question_trgm '
+            'ON questions USING gin (question gin_trgm_ops)')
+    elif dialect == 'sqlite' and 'questions_fts' not in db.engine.table_names() \
+            and fts5_trigram():
+        db.session.execute(
+            "CREATE VIRTUAL TABLE questions_fts USING fts5("
+            "question, content='questions', content_rowid='id', tokenize='trigram')")
+        db.session.execute(
+            "CREATE TRIGGER questions_fts_ai AFTER INSERT ON questions BEGIN "
+            "INSERT INTO questions_fts(rowid, question) VALUES (new.id, new.question); END")
+        db.session.execute(
+            "CREATE TRIGGER questions_fts_ad AFTER DELETE ON questions BEGIN "
+            "INSERT INTO questions_fts(questions_fts, rowid, question) "
+            "VALUES ('delete', old.id, old.question); END")
+        db.session.execute(
+            "CREATE TRIGGER questions_fts_au AFTER UPDATE OF question ON questions BEGIN "
+            "INSERT INTO questions_fts(questions_fts, rowid, question) "
+            "VALUES ('delete', old.id, old.question); "
+            "INSERT INTO questions_fts(rowid, question) VALUES (new.id, new.question); END")
+        db.session.execute("INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')")
+    db.session.commit()
+
+
+'''
+TableVersion
+
+'''
+
+
+class TableVersion(db.Model):
+    """
+    A counter per table, bumped in the transaction of every write to it.
+    The caches of every process compare it with the version they were
+    filled at (see flaskr/main/cache.py).
+    """
+    __tablename__ = 'table_versions'
+
+    name = Column(db.String, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+
+VERSIONED_TABLES = ('questions', 'categories')
+
+
+def setup_table_versions():
+    """
+    creates the version rows that are missing; another process starting
+    at the same time may create them first
+    """
+    existing = {name for name, in db.session.query(TableVersion.name)}
+    for name in VERSIONED_TABLES:
+        if name not in existing:
+            db.session.add(TableVersion(name=name, version=0))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+
+
+def bump_version(name):
+    """adds one to the version of table `name` in the current transaction"""
+    table = TableVersion.__table__
+    db.session.execute(table.update().where(table.c.name == name)
+                       .values(version=table.c.version + 1))
+
+
 '''
 Question
 
@@ -26,6 +135,10 @@ Question
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        # category pages and quiz ids: filtered by category, in id order
+        db.Index('ix_questions_category_id', 'category', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(db.String, nullable=False)
@@ -47,13 +160,16 @@ class Question(db.Model):
 
     def insert(self):
         db.session.add(self)
+        bump_version(self.__tablename__)
         db.session.commit()
 
     def update(self):
+        bump_version(self.__tablename__)
         db.session.commit()
 
     def delete(self):
         db.session.delete(self)
+        bump_version(self.__tablename__)
         db.session.commit()
 
     def format(self):
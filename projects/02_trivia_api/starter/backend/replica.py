@@ -0,0 +1,117 @@
+"""
+Read-replica routing.
+
+When a replica is configured (SQLALCHEMY_REPLICA_URI, or the
+REPLICA_DATABASE_URL environment variable) it is added to
+SQLALCHEMY_BINDS as 'replica', and the session sends the statements of
+GET and HEAD requests there. Everything else goes to the primary:
+
+- other methods, CLI commands and code running outside a request;
+- the rest of a request once its session has flushed a write;
+- for REPLICA_STICKY_SECONDS after a write, requests from the client
+  that made it (a cookie remembers it, so the redirect after a form
+  submission reads what was just written), and every request handled
+  by the process that made it, so that its caches are not refilled
+  from a replica that has not caught up yet;
+- code inside `with use_primary():`.
+"""
+import contextlib
+import os
+import time
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+
+REPLICA_BIND = 'replica'
+STICKY_COOKIE = 'db_primary_until'
+READ_METHODS = {'GET', 'HEAD'}
+
+# time.time() of the last write flushed by this process
+_last_write = 0.0
+
+
+def sticky_seconds(app):
+    return app.config.get('REPLICA_STICKY_SECONDS', 5)
+
+
+def replica_allowed(app, method, primary_until):
+    """
+    Whether a `method` request whose STICKY_COOKIE holds `primary_until`
+    (None without the cookie) may read from the replica.
+    """
+    if REPLICA_BIND not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+        return False
+    if method not in READ_METHODS:
+        return False
+    now = time.time()
+    if now < _last_write + sticky_seconds(app):
+        return False
+    try:
+        return now >= float(primary_until or 0)
+    except ValueError:
+        return True
+
+
+class RoutingSession(SignallingSession):
+    """Session that reads from the replica bind when it is safe to."""
+
+    def __init__(self, db, **options):
+        self.db = db
+        self.wrote = False
+        super().__init__(db, **options)
+
+    def reads_from_replica(self):
+        if self.wrote or not has_request_context() or g.get('use_primary'):
+            return False
+        return replica_allowed(self.app, request.method, request.cookies.get(STICKY_COOKIE))
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.reads_from_replica():
+            return self.db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(session, flush_context):
+    global _last_write
+    session.wrote = True
+    _last_write = time.time()
+    if has_request_context():
+        g.db_wrote = True
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def init_app(self, app):
+        url = app.config.get('SQLALCHEMY_REPLICA_URI') or os.environ.get('REPLICA_DATABASE_URL')
+        if url:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            binds.setdefault(REPLICA_BIND, url)
+            app.config['SQLALCHEMY_BINDS'] = binds
+        super().init_app(app)
+        if REPLICA_BIND in app.extensions:
+            return
+        app.extensions[REPLICA_BIND] = True
+
+        @app.after_request
+        def stick_to_primary(response):
+            if g.get('db_wrote'):
+                seconds = sticky_seconds(app)
+                response.set_cookie(STICKY_COOKIE, str(time.time() + seconds),
+                                    max_age=seconds, httponly=True)
+            return response
+
+
+@contextlib.contextmanager
+def use_primary():
+    """Sends the statements of the block to the primary."""
+    previous = g.get('use_primary', False)
+    g.use_primary = True
+    try:
+        yield
+    finally:
+        g.use_primary = previous
@@ -1,9 +1,15 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
 import unittest
+from unittest import mock
 
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db
+from models import setup_db, db
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -13,6 +19,8 @@ class TriviaTestCase(unittest.TestCase):
         """Define test variables and initialize app."""
         self.app = create_app()
         self.app.config['TESTING'] = True
+        # views over their declared @query_budget fail the test
+        self.app.config['QUERY_BUDGET_STRICT'] = True
         self.client = self.app.test_client
         self.database_name = "trivia_test"
         self.database_path = "postgres://postgres@{}/{}".format(
@@ -62,6 +70,26 @@ class TriviaTestCase(unittest.TestCase):
         for q in res.get_json()["questions"]:
             self.assertEqual(4, q['category'])
 
+    def test_question_list_pages(self):
+        """Test pages and totals stay consistent across a create"""
+        url = '/questions?page={}&current_category=1&search_term='
+        res = self.client().get(url.format(1))
+        total = res.get_json()["total_questions"]
+        ids = [q['id'] for q in res.get_json()["questions"]]
+        self.assertEqual(sorted(ids), ids)
+        if total > len(ids):
+            res = self.client().get(url.format(2))
+            self.assertGreater(res.get_json()["questions"][0]['id'], ids[-1])
+
+        self.client().post('/questions', json={
+            "question": "test question",
+            "answer": "test answer",
+            "difficulty": 3,
+            "category": 1
+        })
+        res = self.client().get(url.format(1))
+        self.assertEqual(total + 1, res.get_json()["total_questions"])
+
     def test_question_list_error(self):
         """Test unsuccessful calls for question list"""
         # wrong parameter
@@ -74,6 +102,89 @@ class TriviaTestCase(unittest.TestCase):
         res = self.client().get('/categories')
         self.assertEqual(200, res.status_code)
 
+    def test_conditional_get(self):
+        """Test unchanged listings are answered with 304 Not Modified"""
+        for url in ['/categories', '/questions?page=1']:
+            res = self.client().get(url)
+            self.assertEqual(200, res.status_code)
+            self.assertEqual('no-cache', res.headers['Cache-Control'])
+            tag = res.headers['ETag']
+            res = self.client().get(url, headers={'If-None-Match': tag})
+            self.assertEqual(304, res.status_code)
+            self.assertEqual(b'', res.data)
+            self.assertEqual(tag, res.headers['ETag'])
+
+        # a new question changes the tag of the question list
+        res = self.client().get('/questions?page=1')
+        tag = res.headers['ETag']
+        self.client().post('/questions', json={
+            "question": "test question",
+            "answer": "test answer",
+            "difficulty": 3,
+            "category": 1
+        })
+        res = self.client().get('/questions?page=1', headers={'If-None-Match': tag})
+        self.assertEqual(200, res.status_code)
+        self.assertNotEqual(tag, res.headers['ETag'])
+
+    def test_conditional_get_other_process(self):
+        """Test a write by another process changes the tags of this one"""
+        from models import Question, bump_version
+        self.app.config['TABLE_VERSION_CHECK_SECONDS'] = 0
+        res = self.client().get('/questions?page=1')
+        tag = res.headers['ETag']
+
+        # what another worker does: its write bumps the shared version,
+        # and only its own caches are invalidated
+        with self.app.app_context():
+            db.session.add(Question("other process", "answer", 1, 1))
+            bump_version('questions')
+            db.session.commit()
+        res = self.client().get('/questions?page=1', headers={'If-None-Match': tag})
+        self.assertEqual(200, res.status_code)
+        self.assertNotEqual(tag, res.headers['ETag'])
+
+    def test_question_count_other_process(self):
+        """Test a cached count is dropped when another process adds a question"""
+        from models import Question, bump_version
+        self.app.config['TABLE_VERSION_CHECK_SECONDS'] = 0
+        total = self.client().get('/questions').get_json()["total_questions"]
+
+        with self.app.app_context():
+            db.session.add(Question("other process", "answer", 1, 1))
+            bump_version('questions')
+            db.session.commit()
+        res = self.client().get('/questions')
+        self.assertEqual(total + 1, res.get_json()["total_questions"])
+
+    def test_health(self):
+        """Test the health check reports the database and the pool"""
+        res = self.client().get('/health')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual('ok', res.get_json()["status"])
+        self.assertIn('checked_out', res.get_json()["pool"])
+
+    def test_category_index(self):
+        """Test category filters are served by ix_questions_category_id"""
+        with self.app.app_context():
+            # small test tables would be scanned whatever the indexes
+            db.session.execute('SET enable_seqscan = off')
+            plan = db.session.execute(
+                'EXPLAIN SELECT id FROM questions WHERE category = 1 '
+                'ORDER BY id LIMIT 10').fetchall()
+            db.session.rollback()
+        self.assertIn('ix_questions_category_id', ' '.join(r[0] for r in plan))
+
+    def test_streamed_list(self):
+        """Test lists over the threshold are streamed as the same JSON"""
+        expected = self.client().get('/categories').get_json()
+        self.app.config['STREAM_JSON_THRESHOLD'] = 2
+        self.app.config['STREAM_JSON_CHUNK_BYTES'] = 16
+        res = self.client().get('/categories')
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(expected, res.get_json())
+        res.close()
+
     def test_category_list_error(self):
         """Test successful calls for category list"""
         # wrong method (405 Method not allowed)
@@ -128,6 +239,246 @@ class TriviaTestCase(unittest.TestCase):
         )
         self.assertEqual(422, res.status_code)
 
+    def test_questions_import_export(self):
+        """Test the JSON lines commands round-trip questions"""
+        runner = self.app.test_cli_runner()
+        res = self.client().get('/questions')
+        total = res.get_json()["total_questions"]
+
+        res = runner.invoke(args=['questions', 'export', '-'])
+        lines = [json.loads(line) for line in res.output.splitlines()
+                 if line.startswith('{')]
+        self.assertEqual(total, len(lines))
+
+        source = '\n'.join([
+            json.dumps({"question": "imported", "answer": "a",
+                        "difficulty": 1, "category": 1}),
+            'not json',
+            json.dumps({"question": "imported", "answer": "a",
+                        "difficulty": 1, "category": 1}),
+        ])
+        res = runner.invoke(args=['questions', 'import', '-',
+                                  '--chunk-size', '1'], input=source)
+        self.assertIn('2 questions imported, 1 errors', res.output)
+        res = self.client().get('/questions')
+        self.assertEqual(total + 2, res.get_json()["total_questions"])
+
+    def test_questions_import_bad_rows(self):
+        """Test a rejected chunk only loses the rows the database refuses"""
+        from models import Question
+        runner = self.app.test_cli_runner()
+        total = self.client().get('/questions').get_json()["total_questions"]
+        with self.app.app_context():
+            taken = db.session.query(db.func.max(Question.id)).scalar()
+
+        row = {"question": "imported", "answer": "a", "difficulty": 1, "category": 1}
+        source = '\n'.join([
+            json.dumps(dict(row, id=taken + 1)),
+            json.dumps(dict(row, id=taken)),
+            json.dumps(dict(row, id=taken + 2)),
+        ])
+        res = runner.invoke(args=['questions', 'import', '-', '--keep-ids',
+                                  '--chunk-size', '3'], input=source)
+        self.assertIn('2 questions imported, 1 errors', res.output)
+        self.assertIn('line 2:', res.output)
+        res = self.client().get('/questions')
+        self.assertEqual(total + 2, res.get_json()["total_questions"])
+
+    def test_seed_data(self):
+        """Test the synthetic data command is deterministic"""
+        import datagen
+        first = list(datagen.questions(200, [1, 2, 3], seed=5))
+        self.assertEqual(first, list(datagen.questions(200, [1, 2, 3], seed=5)))
+        self.assertGreater(sum(q['category'] == 1 for q in first),
+                           sum(q['category'] == 3 for q in first))
+
+        total = self.client().get('/questions').get_json()["total_questions"]
+        res = self.app.test_cli_runner().invoke(args=['seed-data', '--questions', '30'])
+        self.assertEqual(0, res.exit_code, res.output)
+        res = self.client().get('/questions')
+        self.assertEqual(total + 30, res.get_json()["total_questions"])
+
+    def test_asgi_app(self):
+        """Test the ASGI front end answers like the Flask app"""
+        from flaskr.asgi import AsyncApp, request
+        asgi = AsyncApp(self.app)
+
+        async def calls():
+            return await asyncio.gather(
+                request(asgi, 'GET', '/categories'),
+                request(asgi, 'GET', '/questions?page=1&current_category=1'),
+                request(asgi, 'POST', '/quizzes', {'previous_questions': [], 'category': 1}),
+                request(asgi, 'GET', '/health'))
+
+        categories, questions, quiz, health = asyncio.run(calls())
+        for url, (status, headers, body) in [('/categories', categories),
+                                             ('/questions?page=1&current_category=1', questions)]:
+            self.assertEqual(200, status)
+            self.assertEqual(self.client().get(url).get_json(), json.loads(body))
+            self.assertIn('queries', headers['server-timing'])
+            status, _, body = asyncio.run(request(asgi, 'GET', url, headers=[
+                ('If-None-Match', headers['etag'])]))
+            self.assertEqual((304, b''), (status, body))
+        self.assertEqual(200, quiz[0])
+        self.assertEqual(1, json.loads(quiz[2])['question']['category'])
+        # served by the Flask app
+        self.assertEqual(200, health[0])
+        self.assertEqual('ok', json.loads(health[2])['status'])
+
+    def test_asgi_replica_and_budget(self):
+        """Test the ASGI front end reads the replica and keeps the views' budgets"""
+        from sqlalchemy import create_engine
+        from flaskr.asgi import AsyncApp, request
+        from flaskr.instrumentation import QueryBudgetExceeded
+        from flaskr.main import views
+        from models import Category, TableVersion, VERSIONED_TABLES
+        from replica import STICKY_COOKIE
+
+        replica_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'replica.db')
+        replica = create_engine(replica_url)
+        db.metadata.create_all(replica)
+        replica.execute(Category.__table__.insert(), {'type': 'replica category'})
+        replica.execute(TableVersion.__table__.insert(),
+                        [{'name': name, 'version': 0} for name in VERSIONED_TABLES])
+        config = {'SQLALCHEMY_BINDS': {'replica': replica_url}, 'REPLICA_STICKY_SECONDS': 0}
+        with mock.patch.dict(self.app.config, config):
+            asgi = AsyncApp(self.app)
+
+            def categories(*headers):
+                _, _, body = asyncio.run(request(asgi, 'GET', '/categories', headers=headers))
+                return [c['type'] for c in json.loads(body)['categories']]
+
+            self.assertEqual(['replica category'], categories())
+            # a client that has just written reads the primary
+            self.assertNotIn('replica category', categories(
+                ('Cookie', '{}={}'.format(STICKY_COOKIE, time.time() + 60))))
+
+            with mock.patch.object(views.category_list, 'query_budget', 0):
+                self.assertRaises(QueryBudgetExceeded, asyncio.run,
+                                  request(asgi, 'GET', '/categories'))
+        replica.dispose()
+
+    def test_quiz_session(self):
+        """Test a quiz session asks every question of its category once"""
+        res = self.client().post('/quizzes/sessions', json={"category": 1})
+        self.assertEqual(201, res.status_code)
+        session_id = res.get_json()["session_id"]
+        total = res.get_json()["total_questions"]
+        url = '/quizzes/sessions/{}/next'.format(session_id)
+
+        seen = []
+        for remaining in range(total - 1, -1, -1):
+            res = self.client().post(url)
+            self.assertEqual(200, res.status_code)
+            self.assertEqual(remaining, res.get_json()["remaining"])
+            self.assertEqual(1, res.get_json()["question"]["category"])
+            seen.append(res.get_json()["question"]["id"])
+        self.assertEqual(total, len(set(seen)))
+        self.assertIsNone(self.client().post(url).get_json()["question"])
+
+        self.assertEqual(200, self.client().delete(
+            '/quizzes/sessions/{}'.format(session_id)).status_code)
+        self.assertEqual(404, self.client().post(url).status_code)
+        self.assertEqual(404, self.client().post('/quizzes/sessions/unknown/next').status_code)
+
+    def test_quiz_session_skips_deleted(self):
+        """Test questions deleted during a session are skipped"""
+        res = self.client().post('/quizzes/sessions', json={"category": -1})
+        url = '/quizzes/sessions/{}/next'.format(res.get_json()["session_id"])
+        total = res.get_json()["total_questions"]
+        asked = [self.client().post(url).get_json()["question"]["id"]]
+        deleted = next(q["id"] for q in self.client().get('/questions').get_json()["questions"]
+                       if q["id"] not in asked)
+        self.client().delete('/questions/{}'.format(deleted))
+        while True:
+            question = self.client().post(url).get_json()["question"]
+            if question is None:
+                break
+            asked.append(question["id"])
+        self.assertNotIn(deleted, asked)
+        self.assertEqual(total - 1, len(asked))
+
+    def test_quiz_ids_other_process(self):
+        """Test the quiz offers and skips questions changed after its ids were cached"""
+        from models import Question, bump_version
+        self.app.config['TABLE_VERSION_CHECK_SECONDS'] = 0
+        with self.app.app_context():
+            asked = [i for i, in db.session.query(Question.id).filter_by(category=1)]
+
+        def next_question():
+            res = self.client().post('/quizzes', json={
+                'previous_questions': asked, "category": 1})
+            return res.get_json()["question"]
+
+        # builds the id index of the category; every question was asked
+        self.assertIsNone(next_question())
+
+        with self.app.app_context():
+            question = Question("other process", "answer", 1, 1)
+            db.session.add(question)
+            bump_version('questions')
+            db.session.commit()
+            created = question.id
+        self.assertEqual(created, next_question()["id"])
+
+        with self.app.app_context():
+            db.session.delete(Question.query.get(created))
+            bump_version('questions')
+            db.session.commit()
+        self.assertIsNone(next_question())
+
+    def test_quiz_session_skips_many_deleted(self):
+        """Test deleting every question left costs one query, not one per question"""
+        from models import Question
+        category = 9001
+        with self.app.app_context():
+            questions = [Question("session %d" % i, "answer", category, 1) for i in range(4)]
+            db.session.add_all(questions)
+            db.session.commit()
+            ids = [q.id for q in questions]
+        res = self.client().post('/quizzes/sessions', json={"category": category})
+        url = '/quizzes/sessions/{}/next'.format(res.get_json()["session_id"])
+        asked = self.client().post(url).get_json()["question"]["id"]
+        for i in ids:
+            if i != asked:
+                self.client().delete('/questions/{}'.format(i))
+
+        res = self.client().post(url)
+        self.assertEqual(200, res.status_code)
+        self.assertEqual((None, 0), (res.get_json()["question"], res.get_json()["remaining"]))
+        self.client().delete('/questions/{}'.format(asked))
+
+    def test_quiz_session_skips_window(self):
+        """Test a run of deleted questions longer than a window is skipped"""
+        from models import Question
+        from flaskr.main import quiz_sessions
+        from flaskr.main.views import QUIZ_SKIP_WINDOW
+        category = 9002
+        with self.app.app_context():
+            db.session.add_all([Question("window %d" % i, "answer", category, 1)
+                                for i in range(QUIZ_SKIP_WINDOW + 11)])
+            db.session.commit()
+        res = self.client().post('/quizzes/sessions', json={"category": category})
+        session_id = res.get_json()["session_id"]
+        url = '/quizzes/sessions/{}/next'.format(session_id)
+        asked = self.client().post(url).get_json()["question"]["id"]
+        with self.app.app_context():
+            queued = quiz_sessions.peek(session_id, 0, QUIZ_SKIP_WINDOW + 10)
+            # every queued question but the last, more than a window of them
+            Question.query.filter(Question.id.in_(queued[:-1])) \
+                .delete(synchronize_session=False)
+            db.session.commit()
+
+        res = self.client().post(url)
+        self.assertEqual(200, res.status_code)
+        self.assertEqual((queued[-1], 0), (res.get_json()["question"]["id"],
+                                           res.get_json()["remaining"]))
+        self.assertIsNone(self.client().post(url).get_json()["question"])
+        with self.app.app_context():
+            Question.query.filter(Question.id.in_([asked, queued[-1]])) \
+                .delete(synchronize_session=False)
+            db.session.commit()
+
     def test_quiz_get_next(self):
         previous_questions = []
         for _ in range(100):
@@ -11,6 +11,7 @@ class QuizView extends Component {
     this.state = {
         category: null,             // selected category, -1 for all
         previousQuestions: [],      // ids of previous questions.
+        sessionId: null,            // quiz session on the server
         showAnswer: false,
         categories: [],             // all categories
         numCorrect: 0,
@@ -43,21 +44,42 @@ class QuizView extends Component {
     const previousQuestions = [...this.state.previousQuestions];
     if(this.state.currentQuestion) { previousQuestions.push(this.state.currentQuestion.id) }
     this.setState({previousQuestions: previousQuestions},
-        // refresh the previousQuestions before request new quizzes
-        () => {
-            $.ajax({
-      url: '/quizzes',
+        // the server keeps the questions of the quiz: start a session once
+        () => this.state.sessionId ? this.requestNextQuestion() : this.startSession()
+    );
+  };
+
+  startSession = () => {
+    $.ajax({
+      url: '/quizzes/sessions',
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
       data: JSON.stringify({
-        previous_questions: this.state.previousQuestions,
         category: this.state.category
       }),
       xhrFields: {
         withCredentials: true
       },
       crossDomain: true,
+      success: (result) => {
+        this.setState({sessionId: result.session_id}, this.requestNextQuestion);
+      },
+      error: (error) => {
+        alert('Unable to start the quiz. Please try your request again');
+      }
+    })
+  };
+
+  requestNextQuestion = () => {
+    $.ajax({
+      url: `/quizzes/sessions/${this.state.sessionId}/next`,
+      type: "POST",
+      dataType: 'json',
+      xhrFields: {
+        withCredentials: true
+      },
+      crossDomain: true,
       success: (result) => {
         this.setState({
             showAnswer: false,
@@ -71,8 +93,6 @@ class QuizView extends Component {
         alert('Unable to load question. Please try your request again');
       }
     })
-        }
-    );
   };
 
   submitGuess = (event) => {
@@ -106,6 +126,7 @@ class QuizView extends Component {
     this.setState({
         category: null,             // selected category
         previousQuestions: [],      // ids of previous questions.
+        sessionId: null,
         showAnswer: false,
         categories: [],             // all categories
         numCorrect: 0,
@@ -4,7 +4,8 @@ from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database import pooling
+from .database.models import db_drop_and_create_all, setup_db, db, Drink
 from .auth.auth import AuthError, requires_auth
 
 app = Flask(__name__)
@@ -39,6 +40,19 @@ CORS(app)
 '''
 
 
+'''
+GET /health
+    public endpoint for the load balancer
+    returns status code 200 and json {"status": "ok", "database_ms": ..., "pool": {...}}
+        with the connection pool counters of this process, or 503 when the
+        database does not answer
+'''
+@app.route('/health', methods=['GET'])
+def health():
+    body, status = pooling.health(db.engine)
+    return jsonify(body), status
+
+
 '''
 @TODO implement endpoint
     POST /drinks
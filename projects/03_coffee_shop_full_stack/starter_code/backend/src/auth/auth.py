@@ -1,4 +1,8 @@
+import hashlib
 import json
+import threading
+import time
+from collections import OrderedDict
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
@@ -23,7 +27,7 @@ class AuthError(Exception):
 ## Auth Header
 
 '''
-@TODO implement get_token_auth_header() method
+get_token_auth_header() method
     it should attempt to get the header from the request
         it should raise an AuthError if no header is present
     it should attempt to split bearer and the token
@@ -31,24 +35,196 @@ class AuthError(Exception):
     return the token part of the header
 '''
 def get_token_auth_header():
-   raise Exception('Not Implemented')
+    auth = request.headers.get('Authorization', None)
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
 
+    parts = auth.split()
+    if parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    return parts[1]
+
+'''
+permission_set(payload) method
+    the payload's permissions array as a frozenset, or None if the payload
+    has no permissions claim. decode_token computes it once per verified
+    token and caches it next to the payload.
 '''
-@TODO implement check_permissions(permission, payload) method
+def permission_set(payload):
+    permissions = payload.get('permissions')
+    if not isinstance(permissions, list):
+        return None
+    return frozenset(permissions)
+
+'''
+check_permissions(permission, payload) method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink'),
+            or a list/tuple of them
         payload: decoded jwt payload
+        require: 'all' (default) or 'any' of the permissions
+        granted: permission_set(payload), if already known
 
     it should raise an AuthError if permissions are not included in the payload
         !!NOTE check your RBAC settings in Auth0
     it should raise an AuthError if the requested permission string is not in the payload permissions array
     return true otherwise
 '''
-def check_permissions(permission, payload):
-    raise Exception('Not Implemented')
+def check_permissions(permission, payload, require='all', granted=None):
+    if isinstance(permission, str):
+        permission = (permission,) if permission else ()
+    if not permission:
+        return True
+
+    if granted is None:
+        granted = permission_set(payload)
+    if granted is None:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Permissions not included in JWT.'
+        }, 400)
+
+    if require == 'any':
+        allowed = not granted.isdisjoint(permission)
+    else:
+        allowed = granted.issuperset(permission)
+    if not allowed:
+        raise AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)
+    return True
+
+## JWKS
+
+'''
+The signing keys from Auth0 /.well-known/jwks.json are fetched through
+jwks_cache instead of on every request.
+Point it at a local file to work offline:
+    jwks_cache.fetcher = file_fetcher('jwks.json')
+'''
+def url_fetcher(url, timeout=5):
+    """JWKS fetcher reading `url` over HTTP(S)."""
+    def fetch():
+        with urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+    return fetch
+
+
+def file_fetcher(path):
+    """JWKS fetcher reading a local file, for working offline."""
+    def fetch():
+        with open(path) as f:
+            return json.load(f)
+    return fetch
+
+
+class JWKSCache:
+    """Process-wide cache of the signing keys published at a JWKS endpoint.
+
+    Keys are served from memory for `ttl` seconds. After that the cached
+    keys are still served while one background thread refetches them
+    (stale-while-revalidate); only past `max_stale` seconds, or before
+    the first fetch, does a request wait for the fetcher. An unknown
+    `kid` triggers an immediate refetch, which is how rotated keys are
+    picked up. A failed refetch keeps the previous keys.
+
+    Every fetch the cache starts by itself (the first one, a revalidation,
+    one past `max_stale` or for an unknown `kid`) waits until
+    `min_refresh_interval` seconds after the previous attempt, so neither
+    a failing endpoint nor tokens with made-up key ids make it poll.
+    """
+
+    def __init__(self, fetcher, ttl=600, max_stale=86400, min_refresh_interval=30):
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._fetched_at = None
+        self._attempted_at = None
+        self._lock = threading.Lock()
+        self._revalidating = False
+
+    def refresh(self):
+        """Fetches the key set now. Returns False if the fetch failed."""
+        with self._lock:
+            self._attempted_at = time.monotonic()
+        try:
+            jwks = self.fetcher()
+            keys = {key['kid']: key for key in jwks['keys']}
+        except Exception:
+            return False
+        with self._lock:
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+        return True
+
+    def _claim_attempt(self):
+        """Records an attempt now, unless the last one is too recent."""
+        now = time.monotonic()
+        with self._lock:
+            if self._attempted_at is not None and \
+                    now - self._attempted_at < self.min_refresh_interval:
+                return False
+            self._attempted_at = now
+            return True
+
+    def _revalidate(self):
+        try:
+            self.refresh()
+        finally:
+            self._revalidating = False
+
+    def _age(self):
+        if self._fetched_at is None:
+            return None
+        return time.monotonic() - self._fetched_at
+
+    def get_key(self, kid):
+        """The JWK with id `kid`, or None if the issuer does not publish it."""
+        age = self._age()
+        if age is None or age > self.max_stale:
+            if self._claim_attempt():
+                self.refresh()
+                age = self._age()
+            if age is None or age > self.max_stale:
+                return None
+        elif age > self.ttl and self._claim_attempt():
+            with self._lock:
+                revalidate, self._revalidating = not self._revalidating, True
+            if revalidate:
+                threading.Thread(target=self._revalidate, daemon=True).start()
+
+        key = self._keys.get(kid)
+        if key is None and self._claim_attempt():
+            self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+
+jwks_cache = JWKSCache(url_fetcher(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'))
+
 
 '''
-@TODO implement verify_decode_jwt(token) method
+verify_decode_jwt(token) method
     @INPUTS
         token: a json web token (string)
 
@@ -61,26 +237,147 @@ def check_permissions(permission, payload):
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    raise Exception('Not Implemented')
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401)
+    if 'kid' not in unverified_header:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization malformed.'
+        }, 401)
+
+    key = jwks_cache.get_key(unverified_header['kid'])
+    if key is None:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to find the appropriate key.'
+        }, 400)
+    rsa_key = {
+        'kty': key['kty'],
+        'kid': key['kid'],
+        'use': key['use'],
+        'n': key['n'],
+        'e': key['e']
+    }
+
+    try:
+        return jwt.decode(
+            token,
+            rsa_key,
+            algorithms=ALGORITHMS,
+            audience=API_AUDIENCE,
+            issuer='https://' + AUTH0_DOMAIN + '/'
+        )
+    except jwt.ExpiredSignatureError:
+        raise AuthError({
+            'code': 'token_expired',
+            'description': 'Token expired.'
+        }, 401)
+    except jwt.JWTClaimsError:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Incorrect claims. Please, check the audience and issuer.'
+        }, 401)
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
+
+class TokenCache:
+    """LRU cache of verified token payloads, keyed by a hash of the token.
+
+    Each entry holds the payload and its permission_set(). It is served
+    until the `exp` claim passes; tokens without one are never cached.
+    Holds at most `max_size` tokens. The payload dicts are shared between
+    requests and must not be modified.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1:]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, payload, permissions):
+        exp = payload.get('exp')
+        if not isinstance(exp, (int, float)):
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (exp, payload, permissions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def decode_token(token):
+    """
+    (payload, permission_set(payload)) of `token`; verify_decode_jwt is
+    skipped for tokens verified before.
+    """
+    entry = token_cache.get(token)
+    if entry is None:
+        payload = verify_decode_jwt(token)
+        entry = payload, permission_set(payload)
+        token_cache.put(token, *entry)
+    return entry
+
 
 '''
-@TODO implement @requires_auth(permission) decorator method
+@requires_auth(permission) decorator method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink'); several
+            may be given positionally, i.e. requires_auth('get:drinks', 'post:drinks')
+        require: 'all' (default) or 'any' of the given permissions
 
     it should use the get_token_auth_header method to get the token
     it should use the verify_decode_jwt method to decode the jwt
+        (through decode_token, which skips tokens verified before)
     it should use the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
 '''
-def requires_auth(permission=''):
+def requires_auth(*permissions, permission='', require='all'):
+    if require not in ('all', 'any'):
+        raise ValueError("require should be 'all' or 'any'")
+    required = frozenset(p for p in permissions + (permission,) if p)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            payload, granted = decode_token(token)
+            check_permissions(required, payload, require, granted)
             return f(payload, *args, **kwargs)
 
         return wrapper
-    return requires_auth_decorator
\ No newline at end of file
+    return requires_auth_decorator
@@ -1,8 +1,12 @@
 import os
-from sqlalchemy import Column, String, Integer
+import threading
+from sqlalchemy import Column, String, Integer, event
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from . import pooling
+from ..streaming import STREAM_BATCH_SIZE, json_chunks
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
@@ -16,6 +20,8 @@ setup_db(app)
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = pooling.engine_options(
+        app.config, database_path)
     db.app = app
     db.init_app(app)
 
@@ -42,13 +48,24 @@ class Drink(db.Model):
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
     recipe =  Column(String(180), nullable=False)
 
+    '''
+    parsed_recipe()
+        the recipe blob parsed from json, memoized on the instance
+        until recipe is set, expired or refreshed again
+        the returned list is shared and must not be modified
+    '''
+    def parsed_recipe(self):
+        parsed = getattr(self, '_parsed_recipe', None)
+        if parsed is None:
+            parsed = self._parsed_recipe = json.loads(self.recipe)
+        return parsed
+
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
+        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in self.parsed_recipe()]
         return {
             'id': self.id,
             'title': self.title,
@@ -63,7 +80,7 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.parsed_recipe()
         }
 
     '''
@@ -78,6 +95,7 @@ class Drink(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        drinks_changed()
 
     '''
     delete()
@@ -90,6 +108,7 @@ class Drink(db.Model):
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        drinks_changed()
 
     '''
     update()
@@ -102,6 +121,60 @@ class Drink(db.Model):
     '''
     def update(self):
         db.session.commit()
+        drinks_changed()
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return json.dumps(self.short())
+
+
+@event.listens_for(Drink.recipe, 'set')
+def _recipe_set(target, value, oldvalue, initiator):
+    target._parsed_recipe = None
+
+
+@event.listens_for(Drink, 'expire')
+@event.listens_for(Drink, 'refresh')
+def _recipe_reloaded(target, *args):
+    target._parsed_recipe = None
+
+
+'''
+drinks_body(form)
+    the serialized {"success": True, "drinks": drinks} body listing every
+    drink in short() ('short') or long() ('long') form
+    built on first use and kept until insert(), update() or delete() runs
+    in this process
+    EXAMPLE
+        the GET /drinks endpoint can answer with the cached body
+            return Response(drinks_body('short'), mimetype='application/json')
+'''
+_drinks_bodies = {}
+_drinks_version = 0
+_drinks_lock = threading.Lock()
+
+
+def drinks_changed():
+    global _drinks_version
+    with _drinks_lock:
+        _drinks_version += 1
+        _drinks_bodies.clear()
+
+
+def drinks_body(form):
+    if form not in ('short', 'long'):
+        raise ValueError("form should be 'short' or 'long'")
+    with _drinks_lock:
+        if form in _drinks_bodies:
+            return _drinks_bodies[form]
+        version = _drinks_version
+
+    # encoded row by row from the cursor, without a list of dicts
+    drinks = Drink.query.order_by(Drink.id).yield_per(STREAM_BATCH_SIZE)
+    body = b''.join(json_chunks({'success': True}, 'drinks',
+                                (getattr(d, form)() for d in drinks)))
+
+    with _drinks_lock:
+        # a write that raced with the query makes this body stale
+        if version == _drinks_version:
+            _drinks_bodies[form] = body
+    return body
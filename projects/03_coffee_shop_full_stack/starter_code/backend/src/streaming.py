@@ -0,0 +1,41 @@
+'''
+Incremental JSON encoding for the list endpoints.
+
+json_chunks(fields, key, rows)
+    the object `fields` with the list `rows` added under `key`, as UTF-8
+    encoded chunks of about `chunk_bytes`; the items of `rows` are
+    encoded one at a time (with orjson when it is installed) and never
+    collected into a list
+'''
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# rows fetched from a server-side cursor at a time
+STREAM_BATCH_SIZE = 500
+
+
+def dumps(value):
+    """`value` as UTF-8 encoded JSON."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+def json_chunks(fields, key, rows, chunk_bytes=65536):
+    """The object `fields` with the list `rows` added under `key`, in chunks."""
+    envelope = dumps(dict(fields, **{key: []}))
+    # the list is the last member, so the envelope ends with b'[]}'
+    buffer = bytearray(envelope[:-2])
+    for i, row in enumerate(rows):
+        if i:
+            buffer += b','
+        buffer += dumps(row)
+        if len(buffer) >= chunk_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += envelope[-2:]
+    yield bytes(buffer)
@@ -0,0 +1,204 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from src.auth.auth import (AuthError, JWKSCache, TokenCache, check_permissions,
+                           file_fetcher, permission_set, requires_auth, token_cache)
+
+
+class FakeFetcher:
+    """JWKS fetcher publishing the key ids `kids`, failing while they are None."""
+
+    def __init__(self, *kids):
+        self.kids = kids
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.kids is None:
+            raise OSError('JWKS endpoint unreachable')
+        return {'keys': [{'kid': kid, 'kty': 'RSA'} for kid in self.kids]}
+
+
+def age(cache, seconds):
+    """Moves the last fetch and attempt of `cache` `seconds` into the past."""
+    cache._fetched_at -= seconds
+    cache._attempted_at -= seconds
+
+
+def wait_revalidated(cache):
+    deadline = time.monotonic() + 5
+    while cache._revalidating and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+class AuthTestCase(unittest.TestCase):
+    """This class represents the permission checks of the coffee shop"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.payload = {
+            'exp': time.time() + 60,
+            'permissions': ['get:drinks-detail', 'post:drinks', 'patch:drinks']
+        }
+        token_cache.clear()
+        token_cache.hits = token_cache.misses = 0
+        # a verified token, as decode_token would have stored it
+        token_cache.put('token', self.payload, permission_set(self.payload))
+
+    def call(self, view):
+        with self.app.test_request_context(headers={'Authorization': 'Bearer token'}):
+            return view()
+
+    def test_check_permissions(self):
+        self.assertTrue(check_permissions('post:drinks', self.payload))
+        self.assertTrue(check_permissions('', self.payload))
+        self.assertTrue(check_permissions(['post:drinks', 'patch:drinks'], self.payload))
+        self.assertTrue(check_permissions(['delete:drinks', 'patch:drinks'], self.payload, 'any'))
+        with self.assertRaises(AuthError) as cm:
+            check_permissions(['delete:drinks', 'patch:drinks'], self.payload)
+        self.assertEqual(403, cm.exception.status_code)
+        with self.assertRaises(AuthError) as cm:
+            check_permissions('post:drinks', {'exp': 0})
+        self.assertEqual(400, cm.exception.status_code)
+
+    def test_requires_auth(self):
+        @requires_auth('post:drinks', 'patch:drinks')
+        def both(payload):
+            return payload
+
+        @requires_auth('delete:drinks', 'patch:drinks', require='any')
+        def either(payload):
+            return payload
+
+        @requires_auth(permission='delete:drinks')
+        def missing(payload):
+            return payload
+
+        self.assertIs(self.payload, self.call(both))
+        self.assertIs(self.payload, self.call(either))
+        self.assertRaises(AuthError, self.call, missing)
+        self.assertEqual(3, token_cache.hits)
+        self.assertRaises(ValueError, requires_auth, 'post:drinks', require='some')
+
+    def test_permission_set_once_per_token(self):
+        """The permissions array is turned into a set once per verified token"""
+        @requires_auth('post:drinks', 'patch:drinks')
+        def view(payload):
+            return payload
+
+        token_cache.clear()
+        with mock.patch('src.auth.auth.verify_decode_jwt', return_value=self.payload) as verify, \
+                mock.patch('src.auth.auth.permission_set', wraps=permission_set) as to_set:
+            for _ in range(3):
+                self.assertIs(self.payload, self.call(view))
+        self.assertEqual(1, verify.call_count)
+        self.assertEqual(1, to_set.call_count)
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    """This class represents the cache of the Auth0 signing keys"""
+
+    def setUp(self):
+        self.fetch = FakeFetcher('a')
+        self.cache = JWKSCache(self.fetch, ttl=600, max_stale=86400, min_refresh_interval=30)
+
+    def test_ttl(self):
+        self.assertEqual('a', self.cache.get_key('a')['kid'])
+        age(self.cache, 599)
+        self.assertEqual('a', self.cache.get_key('a')['kid'])
+        self.assertEqual(1, self.fetch.calls)
+
+    def test_stale_while_revalidate(self):
+        self.cache.get_key('a')
+        age(self.cache, 601)
+        released = threading.Event()
+        fetch = self.fetch
+
+        def slow_fetch():
+            released.wait(5)
+            return fetch()
+        self.cache.fetcher = slow_fetch
+        self.fetch.kids = ('b',)
+        # served from the old keys while the refetch waits
+        self.assertEqual('a', self.cache.get_key('a')['kid'])
+        released.set()
+        wait_revalidated(self.cache)
+        self.assertEqual('b', self.cache.get_key('b')['kid'])
+        self.assertEqual(2, self.fetch.calls)
+
+    def test_kid_rotation(self):
+        path = os.path.join(tempfile.mkdtemp(), 'jwks.json')
+        with open(path, 'w') as f:
+            json.dump({'keys': [{'kid': 'a'}]}, f)
+        cache = JWKSCache(file_fetcher(path), min_refresh_interval=30)
+        self.assertIsNotNone(cache.get_key('a'))
+        with open(path, 'w') as f:
+            json.dump({'keys': [{'kid': 'b'}]}, f)
+        age(cache, 31)
+        self.assertEqual('b', cache.get_key('b')['kid'])
+        self.assertIsNone(cache.get_key('a'))
+
+    def test_unknown_kid_rate_limit(self):
+        self.cache.get_key('a')
+        for _ in range(10):
+            self.assertIsNone(self.cache.get_key('made-up'))
+        self.assertEqual(1, self.fetch.calls)
+        age(self.cache, 31)
+        self.assertIsNone(self.cache.get_key('made-up'))
+        self.assertEqual(2, self.fetch.calls)
+
+    def test_failed_fetch_keeps_keys(self):
+        self.cache.get_key('a')
+        self.fetch.kids = None
+        age(self.cache, 601)
+        for _ in range(10):
+            self.assertEqual('a', self.cache.get_key('a')['kid'])
+            wait_revalidated(self.cache)
+        # one background attempt, not one per request
+        self.assertEqual(2, self.fetch.calls)
+
+        # past max_stale the keys are refused, with one attempt per interval
+        age(self.cache, 86400)
+        for _ in range(10):
+            self.assertIsNone(self.cache.get_key('a'))
+        self.assertEqual(3, self.fetch.calls)
+
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the cache of verified token payloads"""
+
+    def setUp(self):
+        self.cache = TokenCache(max_size=2)
+        self.payload = {'exp': time.time() + 60, 'permissions': []}
+
+    def test_lru_eviction(self):
+        self.cache.put('a', self.payload, frozenset())
+        self.cache.put('b', self.payload, frozenset())
+        self.assertIsNotNone(self.cache.get('a'))
+        # 'b' is now the least recently used
+        self.cache.put('c', self.payload, frozenset())
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('c'))
+
+    def test_expiry(self):
+        self.cache.put('a', {'exp': time.time() - 1}, frozenset())
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual((0, 1), (self.cache.hits, self.cache.misses))
+
+    def test_no_exp(self):
+        self.cache.put('a', {'permissions': []}, frozenset())
+        self.assertIsNone(self.cache.get('a'))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
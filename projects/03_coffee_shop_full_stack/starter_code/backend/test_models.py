@@ -0,0 +1,73 @@
+import json
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+from src.database import models
+from src.database.models import Drink, db, drinks_body, drinks_changed
+
+RECIPE = [{'color': 'brown', 'name': 'coffee', 'parts': 1}]
+
+
+class DrinkTestCase(unittest.TestCase):
+    """This class represents the recipe and listing caches of the drinks"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        models.database_path = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+        models.setup_db(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        drinks_changed()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def test_parsed_recipe(self):
+        drink = Drink(title='coffee', recipe=json.dumps(RECIPE))
+        parsed = drink.parsed_recipe()
+        self.assertEqual(RECIPE, parsed)
+        self.assertIs(parsed, drink.parsed_recipe())
+
+        water = [{'color': 'blue', 'name': 'water', 'parts': 1}]
+        drink.recipe = json.dumps(water)
+        self.assertEqual(water, drink.parsed_recipe())
+
+        # reloaded attributes may hold another recipe: it is parsed again
+        drink.insert()
+        parsed = drink.parsed_recipe()
+        db.session.expire(drink)
+        self.assertIsNot(parsed, drink.parsed_recipe())
+        parsed = drink.parsed_recipe()
+        db.session.refresh(drink)
+        self.assertIsNot(parsed, drink.parsed_recipe())
+        self.assertEqual(water, drink.parsed_recipe())
+
+    def test_drinks_body(self):
+        def listed(form):
+            return json.loads(drinks_body(form))['drinks']
+
+        self.assertEqual([], listed('short'))
+        drink = Drink(title='coffee', recipe=json.dumps(RECIPE))
+        drink.insert()
+        self.assertEqual([drink.short()], listed('short'))
+        self.assertEqual([drink.long()], listed('long'))
+        # served from the cache until a drink changes
+        self.assertIs(drinks_body('short'), drinks_body('short'))
+
+        drink.title = 'black coffee'
+        drink.update()
+        self.assertEqual('black coffee', listed('long')[0]['title'])
+
+        drink.delete()
+        self.assertEqual([], listed('short'))
+        self.assertRaises(ValueError, drinks_body, 'medium')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,9 @@
 import os
-from flask import Flask
-from models import setup_db
+from flask import Flask, jsonify
+from flask_cors import CORS
+
+import pooling
+from models import setup_db, db
 
 def create_app(test_config=None):
 
@@ -15,6 +18,11 @@ def create_app(test_config=None):
         if excited == 'true': greeting = greeting + "!!!!!"
         return greeting
 
+    @app.route('/health')
+    def health():
+        body, status = pooling.health(db.engine)
+        return jsonify(body), status
+
     @app.route('/coolkids')
     def be_cool():
         return "Be cool, man, be coooool! You're almost a FSND grad!"
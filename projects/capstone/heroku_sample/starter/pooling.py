@@ -0,0 +1,132 @@
+"""
+Engine and connection pool options, read from the app config or the
+environment (the config wins):
+
+    DB_POOL_SIZE            connections kept open per process (5)
+    DB_MAX_OVERFLOW         extra connections allowed under load (10)
+    DB_POOL_TIMEOUT         seconds to wait for a connection (30)
+    DB_POOL_RECYCLE         seconds before a connection is replaced,
+                            -1 never (1800)
+    DB_POOL_PRE_PING        test connections on checkout, so that
+                            connections broken by a failover are
+                            replaced instead of failing a request (true)
+    DB_STATEMENT_TIMEOUT    milliseconds a statement may run, 0 for no
+                            limit; PostgreSQL only (0)
+
+`engine_options()` turns them into SQLALCHEMY_ENGINE_OPTIONS. The pool
+counts its checkouts, timeouts and the time spent waiting for a
+connection; `health()` reports them with a SELECT 1 round trip.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y', 'on'}
+
+SETTINGS = {
+    'DB_POOL_SIZE': (5, int),
+    'DB_MAX_OVERFLOW': (10, int),
+    'DB_POOL_TIMEOUT': (30, float),
+    'DB_POOL_RECYCLE': (1800, int),
+    'DB_POOL_PRE_PING': (True, lambda v: str(v).strip().lower() in TRUE_VALUES),
+    'DB_STATEMENT_TIMEOUT': (0, int),
+}
+
+
+def setting(config, name):
+    default, cast = SETTINGS[name]
+    value = config.get(name) if config is not None else None
+    if value is None:
+        value = os.environ.get(name)
+    return default if value is None else cast(value)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that measures how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._metrics_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def metrics(self):
+        with self._metrics_lock:
+            return {
+                'size': self.size(),
+                'checked_in': self.checkedin(),
+                'checked_out': self.checkedout(),
+                'overflow': self.overflow(),
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_ms_total': round(self.wait_total * 1000, 3),
+                'wait_ms_max': round(self.wait_max * 1000, 3),
+            }
+
+
+def engine_options(config, url):
+    """SQLALCHEMY_ENGINE_OPTIONS for the database at `url`."""
+    url = make_url(url)
+    if url.drivername.startswith('sqlite') and url.database in (None, '', ':memory:'):
+        # one shared connection; Flask-SQLAlchemy installs a StaticPool
+        return {}
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': setting(config, 'DB_POOL_SIZE'),
+        'max_overflow': setting(config, 'DB_MAX_OVERFLOW'),
+        'pool_timeout': setting(config, 'DB_POOL_TIMEOUT'),
+        'pool_recycle': setting(config, 'DB_POOL_RECYCLE'),
+        'pool_pre_ping': setting(config, 'DB_POOL_PRE_PING'),
+    }
+    if url.drivername.startswith('sqlite'):
+        # pooled connections are handed to whichever thread checks them out
+        options['connect_args'] = {'check_same_thread': False}
+    timeout = setting(config, 'DB_STATEMENT_TIMEOUT')
+    if timeout and url.drivername.startswith('postgres'):
+        options['connect_args'] = {'options': '-c statement_timeout={:d}'.format(timeout)}
+    return options
+
+
+def pool_metrics(engine):
+    pool = engine.pool
+    if isinstance(pool, InstrumentedQueuePool):
+        return pool.metrics()
+    return {'status': pool.status()}
+
+
+def health(engine):
+    """(body, status code) of a health check of `engine`."""
+    start = time.perf_counter()
+    try:
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+        status, code = 'ok', 200
+    except SQLAlchemyError:
+        status, code = 'unavailable', 503
+    return {
+        'status': status,
+        'database_ms': round((time.perf_counter() - start) * 1000, 3),
+        'pool': pool_metrics(engine),
+    }, code